@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from convertors import DittoConvertor
+
+
+# the row by row serializer DittoConvertor used before, kept as the reference output
+def serialize_rows(df: pd.DataFrame, res_file) -> None:
+    schema = list(df.columns)[0:]
+    schema = [x for x in schema if x.lower() != "id"]
+    ditto_schema = [x.replace("left_", "").replace("right_", "") for x in schema]
+    for idx, row in df.iterrows():
+        label = row["label"]
+        ditto_row = ""
+        for i in range(len(schema)):
+            if ditto_schema[i].lower() == "label":
+                continue
+            ditto_row += "COL " + ditto_schema[i] + " "
+            ditto_row += "VAL " + str(row[schema[i]]) + " "
+            if "left_" in schema[i] and "right_" in schema[i + 1]:
+                ditto_row += "\t"
+        ditto_row += "\t" + str(label)
+        res_file.write(ditto_row)
+        res_file.write("\n")
+
+
+def main(path: str, repeat: int):
+    # run from the backend dir: python -m benchmarks.ditto_benchmark [dataset.csv] [repeat]
+    df = pd.concat([pd.read_csv(path)] * repeat, ignore_index=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference_path = os.path.join(tmp_dir, "iterrows.txt")
+        start = time.perf_counter()
+        with open(reference_path, "w") as res_file:
+            serialize_rows(df, res_file)
+        print(f"iterrows: {len(df)} rows in {time.perf_counter() - start:.2f}s")
+
+        # the convertor writes into PREPROCESS_PATH, which points to the temporary dir meanwhile
+        preprocess_path = os.environ.get("PREPROCESS_PATH")
+        os.environ["PREPROCESS_PATH"] = tmp_dir
+        try:
+            convertor = DittoConvertor(dataset_id="benchmark", splits={"bench": df})
+            start = time.perf_counter()
+            convertor.convert()
+            print(f"DittoConvertor: {len(df)} rows in {time.perf_counter() - start:.2f}s")
+            output_path = os.path.join(convertor.output_dir_name, "bench.txt")
+        finally:
+            if preprocess_path is None:
+                del os.environ["PREPROCESS_PATH"]
+            else:
+                os.environ["PREPROCESS_PATH"] = preprocess_path
+
+        with open(reference_path) as reference, open(output_path) as output:
+            print("identical output" if reference.read() == output.read() else "OUTPUTS DIFFER")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "datasets/dblp.csv", int(sys.argv[2]) if len(sys.argv) > 2 else 1)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+
+
+def file_signature(path: str) -> tuple:
+    # changes whenever the file is rewritten, used to invalidate cached results
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+class ResultCache:
+    """
+    A content-addressed cache with an in-memory LRU tier and an optional
+    on-disk tier. Entries are addressed by the hash of their key parts, so
+    keys that include the signatures of the input files are invalidated as
+    soon as one of those files changes. The disk tier keeps the most recently
+    used entries (by file mtime, refreshed on every hit) within max_disk_bytes.
+    The *_async methods read and write it in the threadpool.
+    """
+
+    def __init__(self, max_size: int = 128, cache_dir: Optional[str] = None, max_disk_bytes: Optional[int] = None):
+        self._max_size = max_size
+        self._cache_dir = cache_dir
+        self._max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        if cache_dir is not None:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if self._cache_dir is None:
+            return None
+        return os.path.join(self._cache_dir, f"{key}.pkl")
+
+    def _remember(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def _get_memory(self, key: str, default: Any) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return default
+
+    def _get_disk(self, key: str, default: Any) -> Any:
+        path = self._disk_path(key)
+        if path is None or not os.path.isfile(path):
+            return default
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            # the mtime marks the entry as recently used for pruning
+            os.utime(path)
+        except Exception as e:
+            print(f"Exception occured: {e}")
+            return default
+        self._remember(key, value)
+        return value
+
+    def _set_disk(self, key: str, value: Any) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        # write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f)
+        os.replace(tmp_path, path)
+        self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        # removes the least recently used entries until the disk tier fits max_disk_bytes
+        if self._max_disk_bytes is None:
+            return
+        with self._disk_lock:
+            entries = []
+            for path in Path(self._cache_dir).glob("*.pkl"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+            entries.sort()
+            size = sum(entry[1] for entry in entries)
+            for _, entry_size, path in entries[:-1]:
+                if size <= self._max_disk_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                size -= entry_size
+
+    def get(self, key: str, default: Any = None) -> Any:
+        missing = object()
+        value = self._get_memory(key, missing)
+        if value is missing:
+            value = self._get_disk(key, default)
+        return value
+
+    async def get_async(self, key: str, default: Any = None) -> Any:
+        missing = object()
+        value = self._get_memory(key, missing)
+        if value is missing:
+            value = await run_in_threadpool(self._get_disk, key, default)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._remember(key, value)
+        self._set_disk(key, value)
+
+    async def set_async(self, key: str, value: Any) -> None:
+        self._remember(key, value)
+        if self._cache_dir is not None:
+            await run_in_threadpool(self._set_disk, key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        missing = object()
+        value = await self.get_async(key, missing)
+        if value is missing:
+            value = await compute()
+            await self.set_async(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._cache_dir is not None:
+            for path in Path(self._cache_dir).glob("*.pkl"):
+                path.unlink(missing_ok=True)
+
+
+class DataFrameCache:
+    """
+    A thread-safe LRU cache of DataFrames read from disk. Entries are
+    validated against the signature of their file on every access, so a
+    rewritten file is read again, and the least recently used frames are
+    evicted once their total memory usage exceeds max_bytes (by default
+    DATAFRAME_CACHE_SIZE_MB, read on first use so .env files are honoured).
+    Frames larger than max_bytes are not cached at all.
+    Callers get a shallow copy and must not modify the cached values in place.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is None:
+            self._max_bytes = int(os.getenv("DATAFRAME_CACHE_SIZE_MB", 512)) * 1024 * 1024
+        return self._max_bytes
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+    def read_csv(self, path: str, **kwargs) -> pd.DataFrame:
+        return self.load(path, pd.read_csv, **kwargs)
+
+    def load(self, path: str, reader: Callable[..., pd.DataFrame], **kwargs) -> pd.DataFrame:
+        signature = file_signature(path)
+        key = (signature[0], getattr(reader, "__qualname__", repr(reader)),
+               json.dumps(kwargs, sort_keys=True, default=str))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[1].copy(deep=False)
+
+        df = reader(path, **kwargs)
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[2]
+            if size > self.max_bytes:
+                # frames larger than the whole cache are returned uncached
+                return df
+            self._entries[key] = (signature, df, size)
+            self._size += size
+            self._evict()
+        return df.copy(deep=False)
+
+    def invalidate(self, path: str) -> None:
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._size -= self._entries.pop(key)[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+dataframe_cache = DataFrameCache()
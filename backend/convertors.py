@@ -1,4 +1,4 @@
-import copy
+import json
 import os.path
 from abc import ABC, abstractmethod
 from pathlib import Path
@@ -7,11 +7,23 @@ from typing import Type
 import pandas as pd
 
 from enums import MatcherAlgorithm
+from storage import save_df
+
+
+def split_sizes(rows: int, train_ratio=0.7, val_ratio=0.15) -> dict[str, int]:
+    train_size = int(rows * train_ratio)
+    val_size = int(rows * val_ratio)
+
+    return {"train": train_size,
+            "valid": val_size,
+            "test": rows - train_size - val_size
+            }
 
 
 def split(df, train_ratio=0.7, val_ratio=0.15) -> dict[str, pd.DataFrame]:
-    train_size = int(len(df) * train_ratio)
-    val_size = int(len(df) * val_ratio)
+    sizes = split_sizes(len(df), train_ratio=train_ratio, val_ratio=val_ratio)
+    train_size = sizes["train"]
+    val_size = sizes["valid"]
 
     return {"train": df[:train_size],
             "valid": df[train_size:train_size + val_size],
@@ -20,6 +32,15 @@ def split(df, train_ratio=0.7, val_ratio=0.15) -> dict[str, pd.DataFrame]:
 
 
 class Convertor(ABC):
+    """
+    Writes the splits of a dataset in the input format of a matcher. The
+    splits are shared by all convertors of a preprocessing run and must not
+    be modified, convertors derive new frames instead. The hash of the
+    dataset the outputs were written from is stamped into the output dir,
+    so unchanged datasets are not converted again.
+    """
+
+    STAMP_FILE = ".source.json"
 
     def __init__(self, dataset_id, splits):
         self.dataset_id = dataset_id
@@ -30,7 +51,7 @@ class Convertor(ABC):
         Path(self.output_dir_name).mkdir(parents=True, exist_ok=True)
 
     def save_df_as_csv(self, df, name: str) -> None:
-        df.to_csv(os.path.join(self.output_dir_name, f"{name}.csv"), index=False)
+        save_df(df, os.path.join(self.output_dir_name, f"{name}.csv"))
 
     @abstractmethod
     def convert(self) -> None:
@@ -43,15 +64,39 @@ class Convertor(ABC):
 
     @property
     def output_dir_name(self) -> str:
-        return os.path.join(os.getenv("PREPROCESS_PATH", "./preprocess"), self.get_dir_name(), self.dataset_id)
+        return self.get_output_dir_name(self.dataset_id)
+
+    @classmethod
+    def get_output_dir_name(cls, dataset_id: str) -> str:
+        return os.path.join(os.getenv("PREPROCESS_PATH", "./preprocess"), cls.get_dir_name(), dataset_id)
+
+    @classmethod
+    def get_test_path(cls, dataset_id: str) -> str:
+        return os.path.join(cls.get_output_dir_name(dataset_id), "test.csv")
+
+    @classmethod
+    def get_stamp_path(cls, dataset_id: str) -> str:
+        return os.path.join(cls.get_output_dir_name(dataset_id), cls.STAMP_FILE)
+
+    @classmethod
+    def is_converted(cls, dataset_id: str, source_hash: str) -> bool:
+        try:
+            with open(cls.get_stamp_path(dataset_id), "r") as f:
+                return json.load(f).get("source") == source_hash
+        except (OSError, ValueError):
+            return False
+
+    def mark_converted(self, source_hash: str) -> None:
+        with open(self.get_stamp_path(self.dataset_id), "w") as f:
+            json.dump({"source": source_hash, "convertor": type(self).__name__}, f)
 
     @property
     def splits(self) -> dict[str, pd.DataFrame]:
-        return copy.deepcopy(self.__splits__)
+        return dict(self.__splits__)
 
     @property
     def test_path(self) -> str:
-        return os.path.join(self.output_dir_name, "test.csv")
+        return self.get_test_path(self.dataset_id)
 
     @property
     def validation_path(self) -> str:
@@ -73,28 +118,50 @@ class StandardConvertor(Convertor):
 
 
 class DittoConvertor(Convertor):
+    """
+    Serializes every pair as "COL name VAL value ..." for the left and right
+    record, separated by tabs and followed by the label. The lines are built
+    a column at a time and written in blocks of block_size rows.
+    """
+
+    def __init__(self, dataset_id, splits, block_size: int = 50000):
+        super().__init__(dataset_id=dataset_id, splits=splits)
+        self.block_size = block_size
+
     @staticmethod
     def get_dir_name() -> str:
         return MatcherAlgorithm.DITTO.value.lower()
 
+    @staticmethod
+    def column_affixes(columns: list[str]) -> list[tuple[int, str, str]]:
+        # (position, text before the value, text after it) of every serialized column
+        schema = [x for x in columns if x.lower() != "id"]
+        ditto_schema = [x.replace("left_", "").replace("right_", "") for x in schema]
+        affixes = []
+        for i in range(len(schema)):
+            if ditto_schema[i].lower() == "label":
+                continue
+            end = " \t" if "left_" in schema[i] and i + 1 < len(schema) and "right_" in schema[i + 1] else " "
+            affixes.append((columns.index(schema[i]), "COL " + ditto_schema[i] + " VAL ", end))
+        return affixes
+
+    @classmethod
+    def serialize(cls, df: pd.DataFrame) -> pd.Series:
+        # the values are taken from the frame's common dtype and formatted with str,
+        # like the rows iterrows yields
+        columns = list(df.columns)
+        values = df.to_numpy()
+        lines = pd.Series("", index=range(len(df)), dtype=object)
+        for position, prefix, end in cls.column_affixes(columns):
+            lines = lines + prefix + pd.Series(values[:, position], dtype=object).map(str) + end
+        return lines + "\t" + pd.Series(values[:, columns.index("label")], dtype=object).map(str)
+
     def convert(self):
         for name, df in self.splits.items():
-            schema = list(df.columns)[0:]
-            schema = [x for x in schema if x.lower() != "id"]
-            ditto_schema = [x.replace("left_", "").replace("right_", "") for x in schema]
-            with open(os.path.join(self.output_dir_name, f"{name}.txt"), "w+") as res_file:
-                for idx, row in df.iterrows():
-                    label = row["label"]
-                    ditto_row = ""
-                    for i in range(len(schema)):
-                        if ditto_schema[i].lower() == "label":
-                            continue
-                        ditto_row += "COL " + ditto_schema[i] + " "
-                        ditto_row += "VAL " + str(row[schema[i]]) + " "
-                        if "left_" in schema[i] and "right_" in schema[i + 1]:
-                            ditto_row += "\t"
-                    ditto_row += "\t" + str(label)
-                    res_file.write(ditto_row)
+            with open(os.path.join(self.output_dir_name, f"{name}.txt"), "w+", buffering=1024 * 1024) as res_file:
+                for start in range(0, len(df), self.block_size):
+                    lines = self.serialize(df.iloc[start:start + self.block_size])
+                    res_file.write("\n".join(lines))
                     res_file.write("\n")
 
 
@@ -105,8 +172,7 @@ class MCANConvertor(Convertor):
 
     def convert(self):
         for name, df in self.splits.items():
-            df.rename(columns=lambda x: x.replace('left_', 'ltable_'), inplace=True)
-            df.rename(columns=lambda x: x.replace('right_', 'rtable_'), inplace=True)
+            df = df.rename(columns=lambda x: x.replace('left_', 'ltable_').replace('right_', 'rtable_'))
             self.save_df_as_csv(df, name)
 
 
@@ -151,4 +217,5 @@ class ConvertorManager:
 
     @staticmethod
     def get_all_convertors() -> list[Type[Convertor]]:
-        return list(ConvertorManager._mappings.values())
+        # several matchers share a format, every convertor is listed once
+        return list(dict.fromkeys(ConvertorManager._mappings.values()))
@@ -43,3 +43,10 @@ class PerformanceMetric(CaseInsensitiveEnum):
     PRECISION = "precision"
     RECALL = "recall"
     F1 = "f1"
+
+
+class JobStatus(CaseInsensitiveEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
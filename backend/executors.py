@@ -0,0 +1,118 @@
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+
+import docker
+import numpy as np
+
+
+class ContainerExecutor(ABC):
+    """
+    Runs a matcher image with the given environment and volumes and yields
+    the lines the container writes to stdout/stderr as they are produced.
+    """
+
+    @abstractmethod
+    def run(self, image: str, envs: dict, volumes: dict) -> Iterator[str]:
+        pass
+
+
+class DockerExecutor(ContainerExecutor):
+    def __init__(self):
+        self.client = docker.from_env()
+
+    def run(self, image: str, envs: dict, volumes: dict) -> Iterator[str]:
+        container = self.client.containers.run(
+            image=image,
+            detach=True,
+            remove=True,
+            stdout=True,
+            stderr=True,
+            environment=envs,
+            volumes=volumes,
+            device_requests=[
+                docker.types.DeviceRequest(device_ids=["all"], capabilities=[['gpu']])]
+        )
+
+        # the log stream is not line aligned, complete lines are yielded as they arrive
+        finished = False
+        try:
+            pending = b""
+            for chunk in container.logs(stdout=True, stderr=True, stream=True, follow=True):
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    yield line.decode(errors="replace").rstrip("\r")
+            if pending:
+                yield pending.decode(errors="replace").rstrip("\r")
+            finished = True
+        finally:
+            if not finished:
+                # the reader gave up early (e.g. malformed output), the container is not needed anymore
+                try:
+                    container.kill()
+                except Exception as e:
+                    print(f"Exception occured: {e}")
+
+
+class LocalExecutor(ContainerExecutor):
+    """
+    A stand-in for DockerExecutor that needs neither Docker nor a GPU. It
+    prints a short training log with one line per epoch and random scores for
+    the test split of the mounted dataset, seeded by the image and dataset so
+    reruns give the same scores. The scores are written to the SCORES_FILE
+    .npy file like current images do, or with score_output="stdout" printed
+    in the log like older ones.
+    """
+
+    def __init__(self, epoch_seconds: float = 0.0, score_output: str = "file"):
+        self.epoch_seconds = epoch_seconds
+        self.score_output = score_output
+
+    @staticmethod
+    def count_test_rows(volumes: dict) -> int:
+        for host_dir in volumes:
+            for name, header in (("test.csv", 1), ("test.txt", 0)):
+                path = os.path.join(host_dir, name)
+                if os.path.isfile(path):
+                    with open(path, "rb") as f:
+                        return max(sum(1 for _ in f) - header, 0)
+        return 0
+
+    @staticmethod
+    def host_path(container_path: str, volumes: dict) -> Optional[str]:
+        for host_dir, volume in volumes.items():
+            bind = volume["bind"].rstrip("/")
+            if container_path.startswith(bind + "/"):
+                return os.path.join(host_dir, container_path[len(bind) + 1:])
+        return None
+
+    def run(self, image: str, envs: dict, volumes: dict) -> Iterator[str]:
+        epochs = int(envs.get("EPOCHS", 1))
+        yield f"Training {image} on {envs.get('TASK')}"
+        for epoch in range(1, epochs + 1):
+            time.sleep(self.epoch_seconds)
+            yield f"Epoch {epoch}/{epochs}"
+
+        rng = random.Random(f"{image}:{envs.get('TASK')}")
+        scores = [rng.random() for _ in range(self.count_test_rows(volumes))]
+        score_file = self.host_path(envs.get("SCORES_FILE", ""), volumes)
+        if self.score_output == "file" and score_file is not None:
+            np.save(score_file, np.array(scores, dtype=np.float64))
+            yield f"Wrote {len(scores)} scores to {envs['SCORES_FILE']}"
+            return
+        yield "==========test=========="
+        yield "scores"
+        for score in scores:
+            yield str(score)
+        yield "==========test=========="
+
+
+def create_executor() -> ContainerExecutor:
+    # MATCHER_EXECUTOR=local runs the matchers without Docker, e.g. for development and tests
+    if os.getenv("MATCHER_EXECUTOR", "docker").strip().lower() == "local":
+        return LocalExecutor(epoch_seconds=float(os.getenv("LOCAL_EXECUTOR_EPOCH_SECONDS", 0)),
+                             score_output=os.getenv("LOCAL_EXECUTOR_SCORE_OUTPUT", "file"))
+    return DockerExecutor()
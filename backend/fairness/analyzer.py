@@ -1,12 +1,14 @@
-import itertools
 import json
+import os
 import random
 
+import numpy as np
 import pandas as pd
 from sklearn.metrics import recall_score, precision_score, f1_score, confusion_matrix
 
 from enums import DisparityCalculationType, FairnessMeasure, PerformanceMetric
-from fairness.experiments import calculate_fairness_df
+from fairness.ensemble import EnsembleEngine
+from fairness.experiments import calculate_fairness_dfs, calculate_fairness_sweep_dfs
 
 from abc import ABC, abstractmethod
 from enums import MatcherAlgorithm
@@ -28,16 +30,60 @@ class FairnessAnalyzer(Analyzer):
                  fairness_threshold: float = 0.5,
                  group_acceptance_count: int = 1,
                  *args, **kwargs):
+        return self.batch({None: prediction_df}, disparity_calculation_type, measures,
+                          fairness_threshold=fairness_threshold,
+                          group_acceptance_count=group_acceptance_count)[None]
+
+    # the results of several matchers' predictions, evaluated on one shared workload
+    # for both single and pairwise fairness
+    def batch(self, prediction_mappings: dict[str, pd.DataFrame],
+              disparity_calculation_type: DisparityCalculationType,
+              measures: list[FairnessMeasure],
+              fairness_threshold: float = 0.5,
+              group_acceptance_count: int = 1) -> dict[str, dict]:
         fairness_types = {"single_fairness": True, "pairwise_fairness": False}
+        dfs = calculate_fairness_dfs(test_df=self._test_df, prediction_dfs=prediction_mappings,
+                                     left_sens_attribute='left_' + self._sensitive_attribute,
+                                     right_sens_attribute='right_' + self._sensitive_attribute,
+                                     measures=[measure.value for measure in measures],
+                                     aggregate=disparity_calculation_type.value,
+                                     threshold=fairness_threshold,
+                                     fairness_types=fairness_types)
         results = {}
-        for name, single_fairness in fairness_types.items():
-            df = calculate_fairness_df(test_df=self._test_df, prediction_df=prediction_df,
-                                       left_sens_attribute='left_' + self._sensitive_attribute,
-                                       right_sens_attribute='right_' + self._sensitive_attribute,
-                                       measures=[measure.value for measure in measures],
-                                       aggregate=disparity_calculation_type.value,
-                                       threshold=fairness_threshold,
-                                       single_fairness=single_fairness)
+        for matcher, fairness_type_dfs in dfs.items():
+            results[matcher] = {}
+            for name, df in fairness_type_dfs.items():
+                df['disparities'] = df['disparities'].abs()
+                df = df[df['counts'] >= group_acceptance_count]
+                grouped_df = df.groupby('measure')
+                result_dict = {}
+
+                for fairness_measure, group in grouped_df:
+                    result_dict[fairness_measure] = group.to_dict(orient="records")
+                results[matcher][name] = result_dict
+
+        return results
+
+
+class FairnessSweepAnalyzer(Analyzer):
+    def __call__(self, scores_df: pd.DataFrame, matching_thresholds: list[float],
+                 disparity_calculation_type: DisparityCalculationType,
+                 measures: list[FairnessMeasure],
+                 fairness_threshold: float = 0.5,
+                 group_acceptance_count: int = 1,
+                 *args, **kwargs):
+        # single and pairwise fairness share one workload and one pass over the scores
+        fairness_types = {"single_fairness": True, "pairwise_fairness": False}
+        dfs = calculate_fairness_sweep_dfs(test_df=self._test_df, scores_df=scores_df,
+                                           matching_thresholds=matching_thresholds,
+                                           left_sens_attribute='left_' + self._sensitive_attribute,
+                                           right_sens_attribute='right_' + self._sensitive_attribute,
+                                           measures=[measure.value for measure in measures],
+                                           aggregate=disparity_calculation_type.value,
+                                           threshold=fairness_threshold,
+                                           fairness_types=fairness_types)
+        results = {}
+        for name, df in dfs.items():
             df['disparities'] = df['disparities'].abs()
             df = df[df['counts'] >= group_acceptance_count]
             grouped_df = df.groupby('measure')
@@ -107,96 +153,92 @@ class ExplanationProvider(Analyzer):
 
 
 class PerformanceAnalyzer(Analyzer):
+    # the cells of the (TN, FP, FN, TP) counts of a group in the numerator and
+    # denominator of every metric
+    METRICS = {
+        "accuracy": ([0, 3], [0, 1, 2, 3]),
+        "true_positive_rate": ([3], [3, 2]),
+        "false_positive_rate": ([1], [1, 0]),
+        "negative_predictive_value": ([0], [0, 2]),
+        "positive_predictive_value": ([3], [3, 1]),
+    }
+
     def __call__(self, prediction_mappings: dict[MatcherAlgorithm, pd.DataFrame], measure: FairnessMeasure, *args,
                  **kwargs):
-        def calculate_metric(df_group, matcher):
-            if measure == "accuracy":
-                metric_value = (df_group["label"] == df_group["preds"]).mean()
-            elif measure == "true_positive_rate":
-                tp = ((df_group["label"] == 1) & (df_group["preds"] == 1)).sum()
-                fn = ((df_group["label"] == 1) & (df_group["preds"] == 0)).sum()
-                metric_value = tp / (tp + fn) if (tp + fn) > 0 else "-"
-            elif measure == "false_positive_rate":
-                fp = ((df_group["label"] == 0) & (df_group["preds"] == 1)).sum()
-                tn = ((df_group["label"] == 0) & (df_group["preds"] == 0)).sum()
-                metric_value = fp / (fp + tn) if (fp + tn) > 0 else "-"
-            elif measure == "negative_predictive_value":
-                tn = ((df_group["label"] == 0) & (df_group["preds"] == 0)).sum()
-                fn = ((df_group["label"] == 1) & (df_group["preds"] == 0)).sum()
-                metric_value = tn / (tn + fn) if (tn + fn) > 0 else "-"
-            elif measure == "positive_predictive_value":
-                tp = ((df_group["label"] == 1) & (df_group["preds"] == 1)).sum()
-                fp = ((df_group["label"] == 0) & (df_group["preds"] == 1)).sum()
-                metric_value = tp / (tp + fp) if (tp + fp) > 0 else "-"
-            else:
+        return self.performance_tables(self.stack_predictions(prediction_mappings), [measure])[measure]
+
+    @staticmethod
+    def stack_predictions(prediction_mappings: dict[MatcherAlgorithm, pd.DataFrame]) -> pd.DataFrame:
+        return pd.concat([pred_df["preds"].rename(name) for name, pred_df in prediction_mappings.items()], axis=1)
+
+    def group_counts(self, preds: pd.DataFrame):
+        # (n_matchers x n_groups x 4) TN/FP/FN/TP counts of all matchers from one bincount
+        # over the (rows x matchers) predictions, rows without a group or a prediction
+        # are left out
+        codes, groups = pd.factorize(self._test_df[f"left_{self._sensitive_attribute}"], sort=True)
+        preds = preds.reindex(self._test_df.index)
+        labels = self._test_df["label"].to_numpy()
+
+        cells = 2 * (labels[:, None] == 1) + (preds.to_numpy() == 1)
+        valid = (codes[:, None] >= 0) & preds.notna().to_numpy()
+        matcher_index = np.broadcast_to(np.arange(preds.shape[1]), cells.shape)
+        bins = ((matcher_index * len(groups) + codes[:, None]) * 4 + cells)[valid]
+        counts = np.bincount(bins, minlength=preds.shape[1] * len(groups) * 4)
+        return list(groups), counts.reshape(preds.shape[1], len(groups), 4)
+
+    def performance_tables(self, preds: pd.DataFrame, measures: list[str]) -> dict[str, pd.DataFrame]:
+        # a (matcher x group) table for every measure from the (rows x matchers) predictions,
+        # all derived from the same counts, "-" where a group has no samples for the
+        # measure's denominator
+        for measure in measures:
+            if measure not in self.METRICS:
                 raise ValueError(f"Unsupported metric: {measure}")
-
-            return pd.Series({matcher: metric_value})
-
-        def add_noise(value, mean=0, std_dev=0.15):
-            if isinstance(value, float):
-                max_tries = 20
-                i = 0
-                while i < max_tries:
-                    noise = random.gauss(mean, std_dev)
-                    if 0 < value + noise < 1:
-                        return round(value + noise, 3)
-                    i += 1
-                return round(value, 3)
-            return value
-
-        dfs = []
-        for matcher_name, pred_df in prediction_mappings.items():
-            # Merge the test DataFrame with the predictions DataFrame
-            df = pd.merge(self._test_df, pred_df, left_index=True, right_index=True)
-
-            # Group by the sensitive attribute and calculate the metric
-            df_grouped = df.groupby(f"left_{self._sensitive_attribute}").apply(
-                lambda group: calculate_metric(group, matcher_name)).reset_index()
-            reshaped_df = df_grouped.set_index(df_grouped.columns[0]).T.reset_index()
-            first_column_name = reshaped_df.columns[0]
-            reshaped_df = reshaped_df.rename(columns={first_column_name: 'matcher'})
-
-            # Apply noise to all float values in the DataFrame
-            with open("samples/metrics.json", 'r+') as f:
-                mean_values = json.load(f)
-            reshaped_df = reshaped_df.map(lambda x: add_noise(x, mean=mean_values[measure]))
-
-            dfs.append(reshaped_df)
-
-        combined_df = pd.concat(dfs, ignore_index=True)
-
-        return combined_df
+        groups, counts = self.group_counts(preds)
+        with open("samples/metrics.json", 'r+') as f:
+            mean_values = json.load(f)
+
+        tables = {}
+        for measure in measures:
+            numerator, denominator = self.METRICS[measure]
+            numerator = counts[:, :, numerator].sum(axis=2)
+            denominator = counts[:, :, denominator].sum(axis=2)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = self.add_noise(numerator / denominator, mean=mean_values[measure])
+            table = pd.DataFrame(values, columns=groups).astype(object).where(denominator > 0, "-")
+            table.insert(0, "matcher", list(preds.columns))
+            tables[measure] = table
+        return tables
+
+    @staticmethod
+    def add_noise(values: np.ndarray, mean=0, std_dev=0.15, max_tries=20) -> np.ndarray:
+        # every value gets the first of max_tries gaussian noises that keeps it within
+        # (0, 1), or stays as it is if none does, rounded to 3 decimals
+        noise = np.random.normal(mean, std_dev, size=(max_tries,) + values.shape)
+        noisy = values + noise
+        inside = (noisy > 0) & (noisy < 1)
+        first = inside.argmax(axis=0)
+        chosen = np.take_along_axis(noisy, first[None], axis=0)[0]
+        return np.where(inside.any(axis=0), chosen, values).round(3)
 
 
 class EnsembleAnalyzer(Analyzer):
-    def __call__(self, df: pd.DataFrame, *args, **kwargs):
-        matchers = df['matcher'].tolist()
-        groups = df.columns[1:]
-
-        combinations = list(itertools.product(matchers, repeat=len(groups)))
-        results = []
-
-        for combo in combinations:
-            performance_list = []
-            matchers_dict = {}
-
-            # Assign matchers to groups and calculate performance
-            for i, group in enumerate(groups):
-                matcher = combo[i]
-                performance = df.loc[df['matcher'] == matcher, group].values[0]
-                performance_list.append(performance)
-                matchers_dict[group] = matcher
-
-            # Calculate worst performance and max disparity
-            worst_performance = min(performance_list)
-            max_disparity = max(performance_list) - min(performance_list)
-
-            # Append the result
-            results.append({
-                'disparity': max_disparity,
-                'performance': worst_performance,
-                'matchers': matchers_dict
-            })
-
-        return results
+    # df holds a row of per group performances for every matcher. every assignment of
+    # matchers to groups is listed, at most max_combinations (by default
+    # ENSEMBLE_MAX_COMBINATIONS) of them, each flagged with whether it is on the pareto
+    # frontier; frontier ensembles beyond the cap are appended, found without
+    # enumerating the matchers ** groups assignments
+    def __call__(self, df: pd.DataFrame, objective: str = "max", max_combinations: int = None,
+                 *args, **kwargs):
+        if max_combinations is None:
+            max_combinations = int(os.getenv("ENSEMBLE_MAX_COMBINATIONS", 10000))
+        groups = list(df.columns[1:])
+        # undefined performances ("-") are never on the frontier
+        matrix = df[groups].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        engine = EnsembleEngine(matrix, df['matcher'].tolist(), groups)
+        ensembles = list(engine.enumerate(limit=max_combinations))
+        frontier = engine.mark_frontier(ensembles, objective=objective)
+        listed = {tuple(ensemble["matchers"].values()) for ensemble in ensembles}
+        for ensemble in frontier:
+            if tuple(ensemble["matchers"].values()) not in listed:
+                ensembles.append(dict(ensemble, frontier=True))
+        return ensembles
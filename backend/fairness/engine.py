@@ -0,0 +1,174 @@
+import copy
+
+import numpy as np
+from scipy import sparse
+
+from fairness.utils import index_sets_to_csr
+
+
+class ConfusionMatrixEngine:
+    # keeps the TP/FP/TN/FN counts of every workload key as an (n_keys x 4) array
+    # and the left/right attribute indices of every key as boolean (n_keys x n_vals)
+    # membership matrices, so the confusion matrices of all subgroups come out of
+    # one matrix product instead of a python loop over the keys.
+    # with sparse_encoding the memberships and products are kept in CSR form.
+    # the left/right postings are an inverted index from attribute index to the
+    # sorted rows of the keys holding it, used for subgroups of more than one
+    # attribute per side so their cost follows their support, not the key space
+    def __init__(self, entitites_to_count, n_vals, sparse_encoding=False):
+        keys = list(entitites_to_count)
+        self.n_vals = n_vals
+        self.sparse_encoding = sparse_encoding
+        self.counts = np.array(
+            [entitites_to_count[key] for key in keys], dtype=np.int64
+        ).reshape(-1, 4)
+        borders = [key.index(-1) for key in keys]
+        self.left_membership = self.membership(
+            [key[:border] for key, border in zip(keys, borders)]
+        )
+        self.right_membership = self.membership(
+            [key[border + 1:] for key, border in zip(keys, borders)]
+        )
+        self.left_postings = self.postings(self.left_membership)
+        self.right_postings = self.postings(self.right_membership)
+
+    def with_counts(self, counts):
+        # an engine over the same keys with other TP/FP/TN/FN counts, the memberships
+        # and postings are shared
+        engine = copy.copy(self)
+        engine.counts = np.asarray(counts, dtype=np.int64).reshape(-1, 4)
+        return engine
+
+    def membership(self, index_sets):
+        membership = index_sets_to_csr(index_sets, self.n_vals)
+        return membership if self.sparse_encoding else membership.toarray()
+
+    @staticmethod
+    def postings(membership):
+        membership = sparse.csc_matrix(membership)
+        return np.split(membership.indices.astype(np.int64), membership.indptr[1:-1])
+
+    @staticmethod
+    def support(postings, subgroup):
+        # rows of the keys whose side holds every attribute of the subgroup,
+        # intersecting the shortest postings first
+        subgroup = sorted(set(subgroup), key=lambda index: len(postings[index]))
+        rows = postings[subgroup[0]]
+        for index in subgroup[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, postings[index], assume_unique=True)
+        return rows
+
+    @staticmethod
+    def aggregate_rows(rows, counts):
+        return counts[rows].sum(axis=0)
+
+    def indicator(self, subgroups):
+        # (n_vals x n_subgroups) matrix with a 1 for every attribute of a subgroup
+        indicator = index_sets_to_csr(subgroups, self.n_vals).T.astype(np.float64)
+        return indicator.tocsc() if self.sparse_encoding else indicator.toarray()
+
+    def contains(self, membership, indicator, sizes):
+        # a key side contains a subgroup if it has all of the subgroup's attributes
+        if not self.sparse_encoding:
+            return (membership.astype(np.float64) @ indicator) == sizes
+        hits = (membership.astype(np.float64) @ indicator).tocoo()
+        found = hits.data == sizes[hits.col]
+        return sparse.csr_matrix(
+            (np.ones(found.sum(), dtype=bool), (hits.row[found], hits.col[found])),
+            shape=hits.shape,
+        )
+
+    def either(self, a, b):
+        return a.maximum(b) if self.sparse_encoding else a | b
+
+    def both(self, a, b):
+        return a.multiply(b).tocsr() if self.sparse_encoding else a & b
+
+    @staticmethod
+    def aggregate(match, counts):
+        # (n_keys x n_subgroups) boolean match matrix -> (n_subgroups x n_counts) counts
+        return np.asarray(match.T.astype(np.float64) @ counts).astype(np.int64)
+
+    @staticmethod
+    def is_simple(sides):
+        return all(len(set(side)) == 1 for side in sides)
+
+    # counts defaults to the per-key confusion counts, any other (n_keys x n_counts)
+    # array of per-key counts (e.g. one confusion matrix per threshold) can be given
+    def confusion_matrices_single(self, subgroups, counts=None):
+        counts = self.counts if counts is None else counts
+        subgroups = [tuple(subgroup) for subgroup in subgroups]
+        conf_matrices = np.zeros((len(subgroups), counts.shape[1]), dtype=np.int64)
+        simple = [i for i, subgroup in enumerate(subgroups) if self.is_simple([subgroup])]
+        if simple:
+            conf_matrices[simple] = self.product_single([subgroups[i] for i in simple], counts)
+        for i, subgroup in enumerate(subgroups):
+            if not self.is_simple([subgroup]):
+                rows = np.union1d(
+                    self.support(self.left_postings, subgroup),
+                    self.support(self.right_postings, subgroup),
+                )
+                conf_matrices[i] = self.aggregate_rows(rows, counts)
+        return conf_matrices
+
+    def confusion_matrices_pairwise(self, subgroups, counts=None):
+        counts = self.counts if counts is None else counts
+        subgroups = [tuple(subgroup) for subgroup in subgroups]
+        conf_matrices = np.zeros((len(subgroups), counts.shape[1]), dtype=np.int64)
+        halves = [self.halves(subgroup) for subgroup in subgroups]
+        simple = [i for i, sides in enumerate(halves) if self.is_simple(sides)]
+        if simple:
+            conf_matrices[simple] = self.product_pairwise([halves[i] for i in simple], counts)
+        for i, (first, second) in enumerate(halves):
+            if not self.is_simple((first, second)):
+                # the subgroup matches a key in either orientation
+                rows = np.union1d(
+                    np.intersect1d(
+                        self.support(self.left_postings, first),
+                        self.support(self.right_postings, second),
+                        assume_unique=True,
+                    ),
+                    np.intersect1d(
+                        self.support(self.left_postings, second),
+                        self.support(self.right_postings, first),
+                        assume_unique=True,
+                    ),
+                )
+                conf_matrices[i] = self.aggregate_rows(rows, counts)
+        return conf_matrices
+
+    @staticmethod
+    def halves(subgroup):
+        border = int(len(subgroup) / 2)
+        return subgroup[:border], subgroup[border:]
+
+    def product_single(self, subgroups, counts):
+        indicator = self.indicator(subgroups)
+        sizes = np.array([len(set(subgroup)) for subgroup in subgroups])
+        match = self.either(
+            self.contains(self.left_membership, indicator, sizes),
+            self.contains(self.right_membership, indicator, sizes),
+        )
+        return self.aggregate(match, counts)
+
+    def product_pairwise(self, halves, counts):
+        first = [first for first, second in halves]
+        second = [second for first, second in halves]
+        first_sizes = np.array([len(set(s)) for s in first])
+        second_sizes = np.array([len(set(s)) for s in second])
+        first = self.indicator(first)
+        second = self.indicator(second)
+        # the subgroup matches a key in either orientation
+        match = self.either(
+            self.both(
+                self.contains(self.left_membership, first, first_sizes),
+                self.contains(self.right_membership, second, second_sizes),
+            ),
+            self.both(
+                self.contains(self.left_membership, second, second_sizes),
+                self.contains(self.right_membership, first, first_sizes),
+            ),
+        )
+        return self.aggregate(match, counts)
@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+
+
+class EnsembleEngine:
+    # an ensemble assigns one matcher to every group, its performance is the worst
+    # of the assigned (matcher x group) values and its disparity the spread between
+    # the best and the worst of them.
+    # for a worst value lo, the ensemble with the smallest disparity assigns every
+    # group its smallest value >= lo, and any other ensemble whose worst value is lo
+    # is dominated by it. sweeping lo over the distinct values of the matrix with one
+    # searchsorted per group therefore yields every pareto optimal ensemble in
+    # O(n_values * n_groups * log n_matchers) instead of n_matchers ** n_groups.
+    # nan values (e.g. a metric undefined for a group) are never assigned
+    def __init__(self, matrix, matchers, groups):
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape(len(matchers), len(groups))
+        self.matchers = list(matchers)
+        self.groups = list(groups)
+        # the values of every group sorted ascending, with the matcher rows they come from,
+        # equal values keep the matcher order
+        self.order = np.argsort(self.matrix, axis=0, kind="stable")
+        self.sorted = np.take_along_axis(self.matrix, self.order, axis=0)
+        self.valid = (~np.isnan(self.sorted)).sum(axis=0)
+
+    def candidates(self):
+        # (worst, best, matcher rows) of the tightest ensemble of every achievable worst value
+        if len(self.groups) == 0 or self.valid.min() == 0:
+            return []
+        top = self.sorted[self.valid - 1, np.arange(len(self.groups))].min()
+        thresholds = np.unique(self.matrix[~np.isnan(self.matrix)])
+        thresholds = thresholds[thresholds <= top]
+
+        picks = np.empty((len(thresholds), len(self.groups)), dtype=np.int64)
+        for g in range(len(self.groups)):
+            picks[:, g] = np.searchsorted(self.sorted[:self.valid[g], g], thresholds, side="left")
+        values = self.sorted[picks, np.arange(len(self.groups))]
+        rows = self.order[picks, np.arange(len(self.groups))]
+        worst = values.min(axis=1)
+        best = values.max(axis=1)
+
+        # several thresholds may lead to the same ensemble
+        _, first = np.unique(np.stack([worst, best], axis=1), axis=0, return_index=True)
+        return [(worst[i], best[i], rows[i]) for i in np.sort(first)]
+
+    def pareto_frontier(self, objective="max"):
+        # the candidates no other one matches or beats on both the worst value (maximized,
+        # or with objective="min" minimized) and the disparity
+        candidates = sorted(self.candidates(), key=lambda c: c[0], reverse=objective == "max")
+        frontier = []
+        for worst, best, rows in candidates:
+            # every earlier candidate has a better worst value, there is one per worst value
+            if not frontier or best - worst < frontier[-1][1] - frontier[-1][0]:
+                frontier.append((worst, best, rows))
+        return [self.to_dict(worst, best, rows) for worst, best, rows in frontier]
+
+    def mark_frontier(self, ensembles, objective="max"):
+        # flags every ensemble no other one beats on both the worst value and the
+        # disparity, as the chart does; a pareto optimal ensemble beats every such one
+        frontier = self.pareto_frontier(objective=objective)
+        sign = 1.0 if objective == "max" else -1.0
+        performances = sign * np.array([ensemble["performance"] for ensemble in frontier])
+        disparities = np.array([ensemble["disparity"] for ensemble in frontier])
+        for ensemble in ensembles:
+            ensemble["frontier"] = not np.any((performances > sign * ensemble["performance"])
+                                              & (disparities < ensemble["disparity"]))
+        return frontier
+
+    def enumerate(self, limit=None):
+        # every ensemble without nan values, lazily and at most limit of them; the product
+        # only runs over each group's valid matcher rows (in matcher order), so the work is
+        # bounded by limit even if a group has no valid value at all
+        if len(self.groups) == 0 or self.valid.min() == 0:
+            return
+        valid_rows = [np.flatnonzero(~np.isnan(self.matrix[:, g])).tolist() for g in range(len(self.groups))]
+        columns = np.arange(len(self.groups))
+        for combo in itertools.islice(itertools.product(*valid_rows), limit):
+            values = self.matrix[list(combo), columns]
+            yield self.to_dict(values.min(), values.max(), combo)
+
+    def to_dict(self, worst, best, rows):
+        return {
+            "disparity": float(best - worst),
+            "performance": float(worst),
+            "matchers": {group: self.matchers[row] for group, row in zip(self.groups, rows)},
+        }
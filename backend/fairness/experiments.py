@@ -12,8 +12,10 @@ def run_one_workload(
         single_fairness=True,
         k_combinations=1,
         delimiter=",",
+        sparse_encoding=True,
 ):
-    pred_list = predictions_df.values.tolist()
+    # an (n x 1) array, Workload only reads it through np.asarray
+    pred_list = predictions_df.to_numpy()
 
     workload = wl.Workload(
         test_df,
@@ -25,51 +27,122 @@ def run_one_workload(
         delimiter=delimiter,
         single_fairness=single_fairness,
         k_combinations=k_combinations,
+        sparse_encoding=sparse_encoding,
     )
     return [workload]
 
 
-def calculate_fairness_df(
+def calculate_fairness_dfs(
         test_df,
-        prediction_df,
+        prediction_dfs,
         left_sens_attribute,
         right_sens_attribute,
         measures,
         aggregate,
         threshold,
-        single_fairness=True,
+        fairness_types=None,
+        sparse_encoding=True,
 ):
-    workloads = run_one_workload(
-        predictions_df=prediction_df,
-        test_df=test_df,
-        left_sens_attribute=left_sens_attribute,
-        right_sens_attribute=right_sens_attribute,
-        single_fairness=single_fairness
-    )
+    # the fairness of several predictions of the same test_df, e.g. one per matcher,
+    # for every name -> single_fairness of fairness_types. the workload is built once,
+    # the other predictions only swap in their confusion counts and the fairness types
+    # only their subgroups. returns {prediction key: {fairness type name: df}}
+    if fairness_types is None:
+        fairness_types = {"single_fairness": True, "pairwise_fairness": False}
+    dfs = {}
+    workload = None
+    for name, prediction_df in prediction_dfs.items():
+        if workload is None:
+            workload = run_one_workload(
+                predictions_df=prediction_df,
+                test_df=test_df,
+                left_sens_attribute=left_sens_attribute,
+                right_sens_attribute=right_sens_attribute,
+                sparse_encoding=sparse_encoding,
+            )[0]
+        else:
+            workload = workload.with_prediction(prediction_df.to_numpy())
+        dfs[name] = {
+            fairness_type: workload_fairness_df(
+                workload.with_fairness_type(single_fairness), measures, aggregate, threshold
+            )
+            for fairness_type, single_fairness in fairness_types.items()
+        }
+    return dfs
+
 
+def workload_fairness_df(workload, measures, aggregate, threshold):
     fairEM = fem.FairEM(
-        workloads,
+        [workload],
         threshold=threshold,
     )
 
-    binary_fairness = []
-
-    attribute_names = []
-    for k_comb in workloads[0].k_combs_to_attr_names:
-        curr_attr_name = workloads[0].k_combs_to_attr_names[k_comb]
-        attribute_names.append(curr_attr_name)
-
-    df = pd.DataFrame(columns=["measure", "sens_attr", "is_fair"])
+    attribute_names = list(workload.k_combs_to_attr_names.values())
 
+    # the rows of every measure are collected column by column and framed once
+    columns = {"measure": [], "sens_attr": [], "is_fair": [], "counts": [], "disparities": []}
     for measure in measures:
-        temp_df = pd.DataFrame(columns=["measure", "sens_attr", "is_fair"])
         is_fair, counts, disparities = fairEM.is_fair(measure, aggregate)
-        binary_fairness.append(is_fair)
-        temp_df["measure"] = [measure] * len(is_fair)
-        temp_df["sens_attr"] = attribute_names
-        temp_df["is_fair"] = is_fair
-        temp_df["counts"] = counts
-        temp_df["disparities"] = disparities
-        df = pd.concat([temp_df, df])
-
-    return df
+        columns["measure"].extend([measure] * len(is_fair))
+        columns["sens_attr"].extend(attribute_names)
+        columns["is_fair"].extend(is_fair)
+        columns["counts"].extend(counts)
+        columns["disparities"].extend(disparities)
+
+    return pd.DataFrame(columns)
+
+
+def calculate_fairness_sweep_dfs(
+        test_df,
+        scores_df,
+        matching_thresholds,
+        left_sens_attribute,
+        right_sens_attribute,
+        measures,
+        aggregate,
+        threshold,
+        fairness_types=None,
+        sparse_encoding=True,
+):
+    # the workload is built once and every matching threshold is evaluated from a
+    # single pass over the scores, for every name -> single_fairness of fairness_types.
+    # returns {fairness type name: df}
+    if fairness_types is None:
+        fairness_types = {"single_fairness": True, "pairwise_fairness": False}
+    workload = run_one_workload(
+        predictions_df=(scores_df > min(matching_thresholds)).astype(int),
+        test_df=test_df,
+        left_sens_attribute=left_sens_attribute,
+        right_sens_attribute=right_sens_attribute,
+        sparse_encoding=sparse_encoding,
+    )[0]
+
+    dfs = {}
+    for fairness_type, single_fairness in fairness_types.items():
+        typed_workload = workload.with_fairness_type(single_fairness)
+        thresholds, conf_matrices, workload_conf_matrices = typed_workload.sweep_conf_matrices(
+            scores_df.values, matching_thresholds, typed_workload.k_combs
+        )
+        fairEM = fem.FairEM(
+            [typed_workload],
+            threshold=threshold,
+        )
+        attribute_names = [typed_workload.k_combs_to_attr_names[k_comb] for k_comb in typed_workload.k_combs]
+
+        # the rows of every measure and threshold are collected column by column and framed once
+        columns = {"measure": [], "matching_threshold": [], "sens_attr": [], "is_fair": [], "counts": [],
+                   "disparities": []}
+        for measure in measures:
+            for i, matching_threshold in enumerate(thresholds):
+                is_fair, counts, disparities = fairEM.is_fair_at_threshold(
+                    measure, aggregate, conf_matrices[:, i], workload_conf_matrices[i]
+                )
+                columns["measure"].extend([measure] * len(is_fair))
+                columns["matching_threshold"].extend([matching_threshold] * len(is_fair))
+                columns["sens_attr"].extend(attribute_names)
+                columns["is_fair"].extend(is_fair)
+                columns["counts"].extend(counts)
+                columns["disparities"].extend(disparities)
+        dfs[fairness_type] = pd.DataFrame(columns)
+
+    return dfs
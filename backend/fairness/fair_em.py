@@ -59,9 +59,29 @@ class FairEM:
             return workload_fairness >= -self.threshold
 
     def is_fair(self, measure, aggregate, real_distr=False):
-        workload_fairness, counts = self.workloads[0].fairness(
-            self.workloads[0].k_combs, measure, aggregate
+        return self.classify_fairness(
+            measure,
+            aggregate,
+            self.workloads[0].fairness(self.workloads[0].k_combs, measure, aggregate),
+            real_distr,
         )
+
+    # same as is_fair for the subgroup and workload confusion matrices at one
+    # threshold of a Workload.sweep_conf_matrices pass
+    def is_fair_at_threshold(
+            self, measure, aggregate, conf_matrices, workload_conf_matrix, real_distr=False
+    ):
+        return self.classify_fairness(
+            measure,
+            aggregate,
+            self.workloads[0].aggregate_fairness(
+                conf_matrices, workload_conf_matrix, measure, aggregate
+            ),
+            real_distr,
+        )
+
+    def classify_fairness(self, measure, aggregate, fairness, real_distr=False):
+        workload_fairness, counts = fairness
         if aggregate not in ["subtraction based", "division based"]:
             return self.is_fair_measure_specific(measure, workload_fairness)
         else:
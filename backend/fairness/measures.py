@@ -1,39 +1,9 @@
-from fairness.utils import clauses_satisfied
-
-
 def get_confusion_matrix_single(workload, subgroup):
-    subgroup_encoding = workload.create_subgroup_encoding_from_subgroup_single(subgroup)
-    match_TP = match_FP = match_TN = match_FN = 0
-    for entity_to_count in workload.entitites_to_count:
-        left_entity = list(entity_to_count)[:workload.find_border_in_key(entity_to_count)]
-        right_entity = list(entity_to_count)[workload.find_border_in_key(entity_to_count) + 1:]
-        left_entity_encoding = workload.create_subgroup_encoding_from_subgroup_single(left_entity)
-        right_entity_encoding = workload.create_subgroup_encoding_from_subgroup_single(right_entity)
-        if clauses_satisfied(subgroup_encoding, left_entity_encoding) or clauses_satisfied(subgroup_encoding,
-                                                                                           right_entity_encoding):
-            match_TP += workload.entitites_to_count[entity_to_count][workload.TP]
-            match_TN += workload.entitites_to_count[entity_to_count][workload.TN]
-            match_FP += workload.entitites_to_count[entity_to_count][workload.FP]
-            match_FN += workload.entitites_to_count[entity_to_count][workload.FN]
-
-    return match_TP, match_FP, match_TN, match_FN
+    return workload.get_subgroup_conf_matrices([subgroup], single_fairness=True)[0]
 
 
 def get_confusion_matrix_pairwise(workload, subgroup):
-    encoding1, encoding2 = workload.create_subgroup_encodings_from_subgroup_pairwise(subgroup)
-    match_TP = match_FP = match_TN = match_FN = 0
-    for entity_to_count in workload.entitites_to_count:
-        left_entity = list(entity_to_count)[:workload.find_border_in_key(entity_to_count)]
-        right_entity = list(entity_to_count)[workload.find_border_in_key(entity_to_count) + 1:]
-        left_entity_encoding = workload.create_subgroup_encoding_from_subgroup_single(left_entity)
-        right_entity_encoding = workload.create_subgroup_encoding_from_subgroup_single(right_entity)
-        entity_encoding = left_entity_encoding + right_entity_encoding
-        if clauses_satisfied(encoding1, entity_encoding) or clauses_satisfied(encoding2, entity_encoding):
-            match_TP += workload.entitites_to_count[entity_to_count][workload.TP]
-            match_TN += workload.entitites_to_count[entity_to_count][workload.TN]
-            match_FP += workload.entitites_to_count[entity_to_count][workload.FP]
-            match_FN += workload.entitites_to_count[entity_to_count][workload.FN]
-    return match_TP, match_FP, match_TN, match_FN
+    return workload.get_subgroup_conf_matrices([subgroup], single_fairness=False)[0]
 
 
 def AP(TP, FP, TN, FN):
@@ -1,4 +1,5 @@
 import numpy as np
+from scipy import sparse
 
 
 # returns true if all attributes in subgroup1 are present in subgroup2
@@ -9,6 +10,23 @@ def clauses_satisfied(subgroup1, subgroup2):
     return True
 
 
+# builds a (len(index_sets) x n_cols) boolean CSR matrix with the i-th row
+# having a 1 at every index of index_sets[i]
+def index_sets_to_csr(index_sets, n_cols):
+    index_sets = [sorted(set(index_set)) for index_set in index_sets]
+    indptr = np.zeros(len(index_sets) + 1, dtype=np.int64)
+    np.cumsum([len(index_set) for index_set in index_sets], out=indptr[1:])
+    indices = np.fromiter(
+        (index for index_set in index_sets for index in index_set),
+        dtype=np.int64,
+        count=indptr[-1],
+    )
+    return sparse.csr_matrix(
+        (np.ones(len(indices), dtype=bool), indices, indptr),
+        shape=(len(index_sets), n_cols),
+    )
+
+
 # converts a k-combination (2-comb (45, 55, 13, 46)) to a subgroup (encoding)
 # with 1's at those indices
 def comb_to_encoding(combination, full_encoding_len):
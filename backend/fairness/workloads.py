@@ -1,13 +1,21 @@
+import copy
+from functools import cached_property
 from itertools import combinations
 
 import numpy as np
+import pandas as pd
+from scipy import sparse
 
 from fairness import measures
+from fairness.engine import ConfusionMatrixEngine
+from fairness.utils import index_sets_to_csr
 
 
 class Workload:
-    # encoding is a list of vectors. len(encoding) = # of entities pairs
-    # each vector is an encoding for that particular entity pair
+    # encoding is a (# of entities pairs x 2 * # of attribute values) matrix
+    # each row is an encoding for that particular entity pair, built on first access
+    # since the confusion matrices are counted without it. the encodings stay dense,
+    # sparse_encoding only keeps the engine's memberships and products sparse
     def __init__(
             self,
             df,
@@ -19,6 +27,7 @@ class Workload:
             delimiter=",",
             single_fairness=True,
             k_combinations=1,
+            sparse_encoding=False,
     ):
         self.df = df
         self.label_column = label_column
@@ -28,64 +37,121 @@ class Workload:
         self.multiple_sens_attr = multiple_sens_attr
         self.delimiter = delimiter
         self.single_fairness = single_fairness
-        self.sens_attr_vals = self.find_all_sens_attr()
-        self.sens_att_to_index = self.create_sens_att_to_index()
-        self.name_to_encode = {}
-        self.encoding = self.encode()
+        self.sparse_encoding = sparse_encoding
 
         self.TP = 0
         self.FP = 1
         self.TN = 2
         self.FN = 3
 
+        (
+            self.sens_attr_vals,
+            self.sides,
+            self.left_sides,
+            self.right_sides,
+        ) = self.find_all_sens_attr()
+        self.sens_att_to_index = self.create_sens_att_to_index()
+        self.name_to_encode = {}
+
+        self.outcomes = self.calculate_outcomes()
         self.workload_conf_matrix = self.calculate_workload_conf_matrix()
+        self.row_keys, self.key_sides = self.create_row_keys()
         self.entitites_to_count = self.create_entities_to_count()
-        self.k_combs = self.create_k_combs(k_combinations)
-        self.k_combs_to_attr_names = self.k_combs_to_attribute_names()
+        self.engine = ConfusionMatrixEngine(
+            self.entitites_to_count, len(self.sens_attr_vals), sparse_encoding=sparse_encoding
+        )
+        # attribute index -> rows of the keys in entitites_to_count holding it
+        self.left_postings = self.engine.left_postings
+        self.right_postings = self.engine.right_postings
+        # subgroup -> confusion matrix, filled once and shared by every measure and aggregate
+        self.single_conf_matrices = {}
+        self.pairwise_conf_matrices = {}
+        self.k_combinations = k_combinations
+        # single_fairness -> (k_combs, k_combs_to_attr_names), shared by the derived workloads
+        self.k_combs_by_type = {}
+        self.k_combs, self.k_combs_to_attr_names = self.get_k_combs(single_fairness)
+
+    def get_k_combs(self, single_fairness):
+        if single_fairness not in self.k_combs_by_type:
+            workload = copy.copy(self)
+            workload.single_fairness = single_fairness
+            workload.k_combs = workload.create_k_combs(self.k_combinations)
+            self.k_combs_by_type[single_fairness] = (
+                workload.k_combs, workload.k_combs_to_attribute_names()
+            )
+        return self.k_combs_by_type[single_fairness]
+
+    def with_prediction(self, prediction):
+        # a workload of the same entity pairs with other predictions. the vocabulary,
+        # encodings, keys, subgroup memberships and subgroups do not depend on the
+        # predictions and are shared, only the confusion counts are recomputed
+        workload = copy.copy(self)
+        workload.prediction = prediction
+        workload.outcomes = workload.calculate_outcomes()
+        workload.workload_conf_matrix = workload.calculate_workload_conf_matrix()
+        counts = workload.calculate_key_counts()
+        workload.entitites_to_count = workload.create_entities_to_count(counts)
+        workload.engine = self.engine.with_counts(counts)
+        workload.single_conf_matrices = {}
+        workload.pairwise_conf_matrices = {}
+        return workload
+
+    def with_fairness_type(self, single_fairness):
+        # the same workload evaluated for single or pairwise fairness, everything but
+        # the subgroups (including the confusion matrices found so far) is shared
+        if single_fairness == self.single_fairness:
+            return self
+        workload = copy.copy(self)
+        workload.single_fairness = single_fairness
+        workload.k_combs, workload.k_combs_to_attr_names = self.get_k_combs(single_fairness)
+        return workload
 
     def find_all_sens_attr(self):
-        sens_att = set()
-        for it_index, row in self.df.iterrows():
-            left = row[self.sens_att_left]
-            right = row[self.sens_att_right]
-            if self.multiple_sens_attr:
-                for item in left.split(self.delimiter):
-                    sens_att.add(item.strip())
-                for item in right.split(self.delimiter):
-                    sens_att.add(item.strip())
-            else:
-                sens_att.add(left.strip())
-                sens_att.add(right.strip())
-
-        sens_attr_vals = list(sens_att)
-        sens_attr_vals.sort()
-        return sens_attr_vals
+        # every distinct raw value of the left and right columns is split and
+        # stripped once, the tokens are factorized into the sorted vocabulary and
+        # each raw value is mapped to a side: the sorted tuple of its token indices
+        raw = pd.concat(
+            [self.df[self.sens_att_left], self.df[self.sens_att_right]],
+            ignore_index=True,
+        ).astype(str)
+        raw_codes, raw_uniques = pd.factorize(raw)
+
+        tokens = pd.Series(raw_uniques, dtype=object)
+        if self.multiple_sens_attr:
+            tokens = tokens.str.split(self.delimiter).explode()
+        tokens = tokens.str.strip()
+        token_codes, sens_attr_vals = pd.factorize(tokens, sort=True)
+
+        owners = tokens.index.to_numpy()
+        order = np.lexsort((token_codes, owners))
+        boundaries = np.flatnonzero(np.diff(owners[order])) + 1
+        side_to_index = {}
+        raw_to_side = np.array(
+            [
+                side_to_index.setdefault(tuple(chunk.tolist()), len(side_to_index))
+                for chunk in np.split(token_codes[order], boundaries)
+            ],
+            dtype=np.int64,
+        )
+        row_sides = raw_to_side[raw_codes]
+        return (
+            sens_attr_vals.tolist(),
+            list(side_to_index),
+            row_sides[:len(self.df)],
+            row_sides[len(self.df):],
+        )
+
+    @cached_property
+    def encoding(self):
+        return self.encode()
 
     def encode(self):
-        encoding = []
-        for it_index, row in self.df.iterrows():
-            left_att = row[self.sens_att_left]
-            right_att = row[self.sens_att_right]
-            left_vector = np.zeros(len(self.sens_attr_vals))
-            right_vector = np.zeros(len(self.sens_attr_vals))
-            if self.multiple_sens_attr:
-                for item in left_att.split(self.delimiter):
-                    curr_item = item.strip()
-                    idx = self.sens_attr_vals.index(curr_item)
-                    left_vector[idx] = 1
-                for item in right_att.split(self.delimiter):
-                    curr_item = item.strip()
-                    idx = self.sens_attr_vals.index(curr_item)
-                    right_vector[idx] = 1
-            else:
-                curr_item = left_att.strip()
-                idx = self.sens_attr_vals.index(curr_item)
-                left_vector[idx] = 1
-                curr_item = right_att.strip()
-                idx = self.sens_attr_vals.index(curr_item)
-                right_vector[idx] = 1
-            encoding.append(np.concatenate([left_vector, right_vector]))
-        return encoding
+        side_encoding = index_sets_to_csr(self.sides, len(self.sens_attr_vals))
+        encoding = sparse.hstack(
+            [side_encoding[self.left_sides], side_encoding[self.right_sides]],
+            format="csr",
+        )
+        return encoding.toarray().astype(np.float64)
 
     def create_sens_att_to_index(self):
         sens_att_to_index = {}
@@ -94,64 +160,41 @@ class Workload:
             sens_att_to_index[att] = i
         return sens_att_to_index
 
-    def create_hashmap_key(self, row):
-        left_att = row[self.sens_att_left]
-        right_att = row[self.sens_att_right]
-
-        key_left = []
-        key_right = []
-
-        if self.multiple_sens_attr:
-            for item in left_att.split(self.delimiter):
-                curr_item = item.strip()
-                key_left.append(self.sens_att_to_index[curr_item])
-            for item in right_att.split(self.delimiter):
-                curr_item = item.strip()
-                key_right.append(self.sens_att_to_index[curr_item])
-            key_left.sort()
-            key_right.sort()
-        else:
-            curr_item = left_att.strip()
-            key_left.append(self.sens_att_to_index[curr_item])
-            curr_item = right_att.strip()
-            key_right.append(self.sens_att_to_index[curr_item])
-
-        # -1 added as a delimiter between the left and right keys
-        res = (
-            key_left + [-1] + key_right
-            if key_left[0] <= key_right[0]
-            else key_right + [-1] + key_left
+    def calculate_outcomes(self):
+        # TP/FP/TN/FN index of every entity pair
+        prediction = np.asarray(self.prediction).reshape(len(self.prediction), -1)
+        pred = prediction[self.df.index.to_numpy(), 0].astype(bool)
+        ground_truth = self.df[self.label_column].to_numpy().astype(bool)
+        return np.where(
+            pred,
+            np.where(ground_truth, self.TP, self.FP),
+            np.where(ground_truth, self.FN, self.TN),
         )
-        return tuple(res)
 
-    def create_entities_to_count(self):
+    def create_row_keys(self):
+        # -1 added as a delimiter between the left and right keys, the side with
+        # the smaller first index always comes first. returns the key index of
+        # every entity pair and the (left side, right side) of every key
+        first = np.array([side[0] for side in self.sides], dtype=np.int64)
+        swap = first[self.left_sides] > first[self.right_sides]
+        key_left = np.where(swap, self.right_sides, self.left_sides)
+        key_right = np.where(swap, self.left_sides, self.right_sides)
+        row_keys, key_uniques = pd.factorize(key_left * len(self.sides) + key_right)
+        return row_keys, [divmod(key, len(self.sides)) for key in key_uniques.tolist()]
+
+    def calculate_key_counts(self):
+        # (n_keys x 4) TP/FP/TN/FN counts in the order of key_sides
+        return np.bincount(
+            self.row_keys * 4 + self.outcomes, minlength=len(self.key_sides) * 4
+        ).reshape(-1, 4)
+
+    def create_entities_to_count(self, counts=None):
+        counts = self.calculate_key_counts() if counts is None else counts
         entitites_to_count = {}
-        for ind, row in self.df.iterrows():
-            key = self.create_hashmap_key(row)
-            entitites_to_count[key] = [0, 0, 0, 0]
-        for ind, row in self.df.iterrows():
-            key = self.create_hashmap_key(row)
-            self.fill_entities_to_count(
-                entitites_to_count,
-                key,
-                ind,
-                self.prediction[ind],
-                row[self.label_column],
-            )
+        for (left, right), count in zip(self.key_sides, counts.tolist()):
+            entitites_to_count[self.sides[left] + (-1,) + self.sides[right]] = count
         return entitites_to_count
 
-    def fill_entities_to_count(self, entitites_to_count, key, ind, pred, ground_truth):
-        if pred[0]:
-            if ground_truth:
-                entitites_to_count[key][self.TP] += 1
-            else:
-                entitites_to_count[key][self.FP] += 1
-        else:
-            if ground_truth:
-                entitites_to_count[key][self.FN] += 1
-            else:
-                entitites_to_count[key][self.TN] += 1
-
     def find_border_in_key(self, key):
         return key.index(-1)
 
@@ -231,7 +274,6 @@ class Workload:
         return subgroup_encoding
 
     def create_subgroup_encodings_from_subgroup_pairwise(self, subgroup):
-        subgroup_encoding = [0] * 2 * len(self.sens_attr_vals)
         subgroup = list(subgroup)
         border = int(len(subgroup) / 2)
 
@@ -275,24 +317,26 @@ class Workload:
             return measures.positive_predictive_value_parity_pairwise(self, subgroup)
 
     def calculate_workload_conf_matrix(self):
-        conf_matr = [0] * 4
-        for ind, row in self.df.iterrows():
-            pred = self.prediction[ind][0]
-            ground_truth = row[self.label_column]
-            if pred:
-                if ground_truth:
-                    conf_matr[self.TP] += 1
-                else:
-                    conf_matr[self.FP] += 1
-            else:
-                if ground_truth:
-                    conf_matr[self.FN] += 1
-                else:
-                    conf_matr[self.TN] += 1
-        return tuple(conf_matr)
-
-    def calculate_workload_fairness(self, measure):
-        TP, FP, TN, FN = self.workload_conf_matrix
+        return tuple(np.bincount(self.outcomes, minlength=4).tolist())
+
+    def get_subgroup_conf_matrices(self, subgroups, single_fairness=None):
+        if single_fairness is None:
+            single_fairness = self.single_fairness
+        if single_fairness:
+            table = self.single_conf_matrices
+            calculate = self.engine.confusion_matrices_single
+        else:
+            table = self.pairwise_conf_matrices
+            calculate = self.engine.confusion_matrices_pairwise
+        missing = [subgroup for subgroup in subgroups if subgroup not in table]
+        if missing:
+            for subgroup, conf_matrix in zip(missing, calculate(missing)):
+                table[subgroup] = tuple(int(x) for x in conf_matrix)
+        return [table[subgroup] for subgroup in subgroups]
+
+    @staticmethod
+    def calculate_measure(measure, conf_matrix):
+        TP, FP, TN, FN = conf_matrix
         if measure == "accuracy_parity":
             return measures.AP(TP, FP, TN, FN)
         elif measure == "statistical_parity":
@@ -306,35 +350,64 @@ class Workload:
         elif measure == "positive_predictive_value_parity":
             return measures.PPV(TP, FP, TN, FN)
 
-    def fairness(self, subgroups, measure, aggregate="distribution"):
-        counts = []
-        if self.single_fairness:
-            values = [
-                self.calculate_fairness_single(subgroup, measure)
-                for subgroup in subgroups
-            ]
-            for subgroup in subgroups:
-                counts.append(
-                    measures.get_confusion_matrix_single(self, subgroup)[0]
-                    + measures.get_confusion_matrix_single(self, subgroup)[1]
-                    + measures.get_confusion_matrix_single(self, subgroup)[2]
-                    + measures.get_confusion_matrix_single(self, subgroup)[3]
-                )
+    def calculate_workload_fairness(self, measure):
+        return self.calculate_measure(measure, self.workload_conf_matrix)
+
+    def calculate_sweep_counts(self, scores, thresholds):
+        # per-key confusion counts at every one of the sorted thresholds as an
+        # (n_keys x n_thresholds * 4) array. a pair is a predicted match at
+        # threshold j iff its score is above thresholds[j], so every pair is put
+        # in the bucket of the number of thresholds below its score in one pass
+        # and the predicted matches at j are the cumulative count of the buckets above j
+        scores = np.asarray(scores, dtype=np.float64).reshape(len(scores), -1)
+        scores = scores[self.df.index.to_numpy(), 0]
+        ground_truth = self.df[self.label_column].to_numpy().astype(np.int64)
+        n_keys = len(self.key_sides)
+        n_buckets = len(thresholds) + 1
+        buckets = np.searchsorted(thresholds, scores, side="left")
+        histogram = np.bincount(
+            (self.row_keys * 2 + ground_truth) * n_buckets + buckets,
+            minlength=n_keys * 2 * n_buckets,
+        ).reshape(n_keys, 2, n_buckets)
+        above = np.cumsum(histogram[:, :, ::-1], axis=2)[:, :, ::-1][:, :, 1:]
+        totals = histogram.sum(axis=2, keepdims=True)
+
+        counts = np.zeros((n_keys, len(thresholds), 4), dtype=np.int64)
+        counts[:, :, self.TP] = above[:, 1]
+        counts[:, :, self.FP] = above[:, 0]
+        counts[:, :, self.TN] = totals[:, 0] - above[:, 0]
+        counts[:, :, self.FN] = totals[:, 1] - above[:, 1]
+        return counts.reshape(n_keys, -1)
+
+    def sweep_conf_matrices(self, scores, thresholds, subgroups, single_fairness=None):
+        # confusion matrices of the subgroups and of the whole workload for a grid
+        # of matching thresholds, from a single pass over the scores. returns the
+        # sorted distinct thresholds, an (n_subgroups x n_thresholds x 4) array and
+        # an (n_thresholds x 4) array
+        if single_fairness is None:
+            single_fairness = self.single_fairness
+        if single_fairness:
+            calculate = self.engine.confusion_matrices_single
         else:
-            values = [
-                self.calculate_fairness_pairwise(subgroup, measure)
-                for subgroup in subgroups
-            ]
-            for subgroup in subgroups:
-                counts.append(
-                    measures.get_confusion_matrix_pairwise(self, subgroup)[0]
-                    + measures.get_confusion_matrix_pairwise(self, subgroup)[1]
-                    + measures.get_confusion_matrix_pairwise(self, subgroup)[2]
-                    + measures.get_confusion_matrix_pairwise(self, subgroup)[3]
-                )
+            calculate = self.engine.confusion_matrices_pairwise
+        thresholds = np.unique(np.asarray(thresholds, dtype=np.float64))
+        counts = self.calculate_sweep_counts(scores, thresholds)
+        subgroups = list(subgroups)
+        conf_matrices = calculate(subgroups, counts).reshape(len(subgroups), len(thresholds), 4)
+        workload_conf_matrices = counts.reshape(-1, len(thresholds), 4).sum(axis=0)
+        return thresholds.tolist(), conf_matrices, workload_conf_matrices
+
+    def fairness(self, subgroups, measure, aggregate="distribution"):
+        conf_matrices = self.get_subgroup_conf_matrices(subgroups)
+        return self.aggregate_fairness(conf_matrices, self.workload_conf_matrix, measure, aggregate)
+
+    def aggregate_fairness(self, conf_matrices, workload_conf_matrix, measure, aggregate="distribution"):
+        conf_matrices = [tuple(int(x) for x in conf_matrix) for conf_matrix in conf_matrices]
+        values = [self.calculate_measure(measure, conf_matrix) for conf_matrix in conf_matrices]
+        counts = [sum(conf_matrix) for conf_matrix in conf_matrices]
 
         # make the measure a parity by subtracting the model performance
-        workload_fairness = self.calculate_workload_fairness(measure)
+        workload_fairness = self.calculate_measure(measure, tuple(int(x) for x in workload_conf_matrix))
         # values = [x - workload_fairness for x in values]
 
         if aggregate == "subtraction based":
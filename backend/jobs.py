@@ -0,0 +1,200 @@
+import asyncio
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Optional, Type
+
+from enums import JobStatus
+from matchers import Matcher
+from scheduler import MatcherScheduler, SchedulerFull
+from singleton import Singleton
+
+EPOCH_PATTERN = re.compile(r"epoch\D{0,3}(\d+)(?:\s*(?:/|of)\s*(\d+))?", re.IGNORECASE)
+
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
+class Job:
+    """
+    A request to find the scores of a dataset with a set of matchers. Keeps
+    the status and epoch progress of every matcher, the most recent events
+    for late subscribers and the asyncio queues of the live subscribers.
+    """
+
+    def __init__(self, dataset_id: str, matcher_classes: list[Type[Matcher]], epochs: int,
+                 max_events: int = 1000):
+        self.id = uuid.uuid4().hex
+        self.dataset_id = dataset_id
+        self.epochs = epochs
+        self.matcher_classes = matcher_classes
+        self.status = JobStatus.QUEUED
+        self.matchers = {
+            matcher_class.get_name(): {"status": JobStatus.QUEUED.value, "epoch": 0, "epochs": epochs, "error": None}
+            for matcher_class in matcher_classes
+        }
+        self.results = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = deque(maxlen=max_events)
+        self.subscribers = []
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "dataset_id": self.dataset_id,
+            "epochs": self.epochs,
+            "status": self.status.value,
+            "matchers": self.matchers,
+            "results": self.results,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+@Singleton
+class JobManager:
+    """
+    Keeps the jobs submitted to this process. Finished jobs are dropped once
+    they are older than JOB_TTL_SECONDS, or beyond the MAX_FINISHED_JOBS most
+    recent ones, whenever a new job is submitted.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.ttl = float(os.getenv("JOB_TTL_SECONDS", 3600))
+        self.max_finished = int(os.getenv("MAX_FINISHED_JOBS", 256))
+
+    # the matchers of the job are queued on the MatcherScheduler right away, a matcher
+    # that cannot be scheduled fails. raises SchedulerFull if none of them could be admitted
+    def submit(self, dataset_id: str, matcher_classes: list[Type[Matcher]], epochs: int = 1,
+               priority: int = 0) -> Job:
+        job = Job(dataset_id=dataset_id, matcher_classes=matcher_classes, epochs=epochs)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._set_status(job, JobStatus.RUNNING)
+        rejected = []
+        for matcher_class in matcher_classes:
+            try:
+                self._schedule_matcher(job, matcher_class, priority)
+            except SchedulerFull as e:
+                rejected.append(e)
+                self._finish_matcher(job, matcher_class.get_name(), error=str(e))
+            except Exception as e:
+                # e.g. the inputs of the matcher could not be converted, the other matchers still run
+                self._finish_matcher(job, matcher_class.get_name(), error=str(e))
+        if not matcher_classes:
+            self._set_status(job, JobStatus.SUCCEEDED)
+        elif len(rejected) == len(matcher_classes):
+            with self._lock:
+                del self._jobs[job.id]
+            raise rejected[0]
+        return job
+
+    def _prune(self) -> None:
+        # called with the lock held
+        finished = sorted((job for job in self._jobs.values() if job.status in FINISHED and job.finished_at),
+                          key=lambda job: job.finished_at)
+        expired = [job for job in finished if job.finished_at < time.time() - self.ttl]
+        expired += finished[len(expired):max(len(finished) - self.max_finished, len(expired))]
+        for job in expired:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    # returns a queue that first receives the job's recorded events and then every
+    # new one, or None for an unknown job
+    def subscribe(self, job_id: str, loop: asyncio.AbstractEventLoop) -> Optional[asyncio.Queue]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            queue = asyncio.Queue()
+            for event in job.events:
+                queue.put_nowait(event)
+            job.subscribers.append((loop, queue))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.subscribers = [(loop, q) for loop, q in job.subscribers if q is not queue]
+
+    def _publish(self, job: Job, event: dict) -> None:
+        event = dict(event, job_id=job.id, time=time.time())
+        with self._lock:
+            job.events.append(event)
+            subscribers = list(job.subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # the subscriber's event loop is closed
+                self.unsubscribe(job.id, queue)
+
+    def _set_status(self, job: Job, status: JobStatus, matcher: Optional[str] = None, error: str = None) -> None:
+        if matcher is None:
+            job.status = status
+            if status in FINISHED:
+                job.finished_at = time.time()
+        else:
+            job.matchers[matcher]["status"] = status.value
+            job.matchers[matcher]["error"] = error
+        self._publish(job, {"type": "status", "matcher": matcher, "status": status.value, "error": error})
+
+    def _on_log(self, job: Job, matcher: str, line: str) -> None:
+        self._publish(job, {"type": "log", "matcher": matcher, "line": line})
+        match = EPOCH_PATTERN.search(line)
+        if match:
+            progress = job.matchers[matcher]
+            progress["epoch"] = int(match.group(1))
+            if match.group(2):
+                progress["epochs"] = int(match.group(2))
+            self._publish(job, {"type": "progress", "matcher": matcher,
+                                "epoch": progress["epoch"], "epochs": progress["epochs"]})
+
+    def _schedule_matcher(self, job: Job, matcher_class: Type[Matcher], priority: int) -> None:
+        name = matcher_class.get_name()
+        matcher = matcher_class(dataset_id=job.dataset_id, epochs=job.epochs)
+        scores_path = os.path.join(matcher.scores_dir, "preds.csv")
+        # converts the inputs and sets run_key, which the run below trains for
+        if matcher.restore_cached_scores():
+            self._finish_matcher(job, name, scores_path=scores_path)
+            return
+
+        def run(log: Callable[[str], None]) -> str:
+            matcher.log_listener = log
+            matcher.find_scores()
+            return scores_path
+
+        # runs of other jobs with the same matcher, dataset and score key are shared
+        future = MatcherScheduler.instance().submit(
+            key=(name, job.dataset_id, matcher.run_key), image=matcher.image_name, run=run, priority=priority,
+            on_start=lambda: self._set_status(job, JobStatus.RUNNING, matcher=name),
+            on_log=lambda line: self._on_log(job, name, line))
+        future.add_done_callback(lambda f: self._finish_matcher(
+            job, name, scores_path=None if f.exception() else f.result(),
+            error=str(f.exception()) if f.exception() else None))
+
+    def _finish_matcher(self, job: Job, name: str, scores_path: str = None, error: str = None) -> None:
+        if error is None:
+            job.results[name] = {"scores_path": scores_path}
+            self._set_status(job, JobStatus.SUCCEEDED, matcher=name)
+        else:
+            print(f"Exception occured: {error}")
+            self._set_status(job, JobStatus.FAILED, matcher=name, error=error)
+        with self._lock:
+            statuses = [JobStatus(progress["status"]) for progress in job.matchers.values()]
+            done = job.status not in FINISHED and all(status in FINISHED for status in statuses)
+            if done:
+                # claimed under the lock so the job status is published once
+                job.status = JobStatus.SUCCEEDED if JobStatus.FAILED not in statuses else JobStatus.FAILED
+        if done:
+            self._set_status(job, job.status)
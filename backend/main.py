@@ -1,22 +1,30 @@
+import asyncio
 import json
 import os
 import random
 import copy
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Type
 
-import pandas as pd
+import numpy as np
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Query
+from fastapi import FastAPI, UploadFile, File, Query, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
-from convertors import split, ConvertorManager, StandardConvertor
-from enums import DisparityCalculationType, FairnessMeasure, MatcherAlgorithm, PerformanceMetric
-from fairness.analyzer import FairnessAnalyzer, ExplanationProvider, PerformanceAnalyzer, EnsembleAnalyzer
+from cache import ResultCache, dataframe_cache, file_signature
+import tasks
+from convertors import StandardConvertor
+from enums import DisparityCalculationType, FairnessMeasure, JobStatus, MatcherAlgorithm, PerformanceMetric
+from jobs import FINISHED, JobManager
 from matchers import MatcherManager
 from predictors import PredictorManager, Predictor
-from utils import load_dataset_as_df
+from preprocessing import ensure_converted
+from profiles import profile_csv
+from scheduler import MatcherScheduler, SchedulerFull
+from storage import sync_parquet
+from utils import build_dataset_profile, load_dataset_as_df, load_dataset_profile, save_upload
+from workers import run_in_process, shutdown_worker_pool
 
 load_dotenv()
 
@@ -25,7 +33,11 @@ def startup():
     Path(os.getenv("DATASET_UPLOAD_PATH", "./datasets")).mkdir(parents=True, exist_ok=True)
 
 
-app = FastAPI(on_startup=[startup])
+app = FastAPI(on_startup=[startup], on_shutdown=[shutdown_worker_pool])
+
+fairness_cache = ResultCache(max_size=int(os.getenv("FAIRNESS_CACHE_SIZE", 128)),
+                             cache_dir=os.getenv("FAIRNESS_CACHE_PATH", "./cache/fairness"),
+                             max_disk_bytes=int(os.getenv("FAIRNESS_CACHE_DISK_SIZE_MB", 256)) * 1024 * 1024)
 
 origins = ["http://localhost:3000", "http://127.0.0.1:3000", os.getenv("PUBLIC_IP", "http://127.0.0.1:3000")]
 
@@ -43,16 +55,31 @@ async def upload_dataset(file: UploadFile = File(...)):
     if not file.filename.endswith(".csv"):
         return {"message": "Please upload a CSV file."}
 
+    # TODO: add a random hash id to end of filename
+    path = os.path.join(os.getenv("DATASET_UPLOAD_PATH", "./datasets"), file.filename)
+    tmp_path = f"{path}.{os.getpid()}.{id(file)}.tmp"
     try:
-        df = pd.read_csv(file.file)
+        # the upload is streamed to disk and profiled in chunks, never held in memory whole
+        await save_upload(file, tmp_path, chunk_size=int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024)))
+        profile = await run_in_threadpool(profile_csv, tmp_path,
+                                          chunksize=int(os.getenv("PROFILE_CHUNK_ROWS", 100_000)))
     except Exception as e:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
         return {"message": f"Error reading CSV file: {str(e)}"}
 
-    # TODO: add a random hash id to end of filename
-    df.to_csv(os.path.join(os.getenv("DATASET_UPLOAD_PATH", "./datasets"), file.filename), index=False)
+    os.replace(tmp_path, path)
+    dataset_id = file.filename.replace(".csv", "")
+    profile = await run_in_threadpool(build_dataset_profile, dataset_id, profile)
+    await run_in_threadpool(sync_parquet, path)
 
     return {
-        "id": file.filename.replace(".csv", ""),
+        "id": dataset_id,
+        "columns": profile["columns"],
+        "rows": profile["rows"],
+        "warnings": profile["warnings"],
+        "groups": {column: [value for value, count in frequencies]
+                   for column, frequencies in profile["frequencies"].items()},
     }
 
 
@@ -74,7 +101,7 @@ def get_template_datasets():
 
 @app.get("/v1/definitions/")
 def get_definitions():
-    df = pd.read_csv("definitions.csv")
+    df = dataframe_cache.read_csv("definitions.csv")
     result = {}
     for index, row in df.iterrows():
         result[str(row['key']).strip().lower().replace('"', "")] = row['definition']
@@ -99,53 +126,90 @@ def get_options():
 
 @app.get("/v1/datasets/{dataset_id}/")
 def get_dataset_details(dataset_id: str):
-    df = load_dataset_as_df(dataset_id)
-    columns = set([str(c).replace("left_", "").replace("right_", "") for c in df.columns])
+    profile = load_dataset_profile(dataset_id)
+    columns = set([str(c).replace("left_", "").replace("right_", "") for c in profile["columns"]])
     columns.discard("id")
     columns.discard("label")
-    return {"columns": columns, "rows": len(df)}
+    # profiles written before warnings were recorded have none
+    return {"columns": columns, "rows": profile["rows"], "splits": profile["splits"],
+            "warnings": profile.get("warnings", [])}
 
 
 @app.get("/v1/datasets/{dataset_id}/groups/")
 def get_dataset_groups(dataset_id: str, sensitive_attribute: str):
-    df = load_dataset_as_df(dataset_id)
-    distinct_values = set(df[f"left_{sensitive_attribute}"].unique().tolist())
-    return {"groups": distinct_values}
+    frequencies = load_dataset_profile(dataset_id)["frequencies"].get(f"left_{sensitive_attribute}")
+    if frequencies is None:
+        # not profiled as a candidate sensitive attribute, e.g. too many distinct values
+        df = load_dataset_as_df(dataset_id, columns=[f"left_{sensitive_attribute}"])
+        return {"groups": set(df[f"left_{sensitive_attribute}"].unique().tolist())}
+    return {"groups": set(value for value, count in frequencies)}
 
 
 @app.get("/v1/datasets/{dataset_id}/preprocess/")
-async def preprocess(dataset_id: str):
-    datasets_splits = split(load_dataset_as_df(dataset_id))
-    for convertor_class in ConvertorManager.get_all_convertors():
-        convertor_class(dataset_id=dataset_id, splits=datasets_splits).convert()
+async def preprocess(dataset_id: str, matchers: List[str] = Query(None)):
+    # only the test split and the formats of the given matchers are written now, the
+    # other formats are written when a matcher first needs them
+    manager: MatcherManager = MatcherManager.instance()
+    convertor_classes = [StandardConvertor] + [manager.get_matcher(m).get_convertor_class() for m in matchers or []]
+    await run_in_process(tasks.preprocess_dataset, dataset_id, convertor_classes)
 
     return {"successful": True}
 
 
 @app.get("/v1/datasets/{dataset_id}/match/")
-async def find_scores(dataset_id: str, matchers: List[str] = Query(None), epochs: int = 1):
-    return {"successful": True}
-
+async def find_scores(dataset_id: str, matchers: List[str] = Query(None), epochs: int = 1, priority: int = 0):
+    # the matchers run in the background as the MatcherScheduler admits them, progress is
+    # streamed on /ws/jobs/{job_id} and the status and results are polled on /v1/jobs/{job_id}/
     manager: MatcherManager = MatcherManager.instance()
-    matcher_classes = set()
-    with ThreadPoolExecutor() as executor:
-        futures = []
-        for ma in matchers:
-            matcher_class = manager.get_matcher(ma)
+    matcher_classes = []
+    for ma in matchers:
+        matcher_class = manager.get_matcher(ma)
+        if matcher_class not in matcher_classes:
+            matcher_classes.append(matcher_class)
 
-            if matcher_class in matcher_classes:
-                continue
+    try:
+        # submitting converts the matchers' inputs and hashes them, off the event loop
+        job = await run_in_threadpool(JobManager.instance().submit, dataset_id=dataset_id,
+                                      matcher_classes=matcher_classes, epochs=epochs, priority=priority)
+    except SchedulerFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"successful": True, "job_id": job.id}
 
-            matcher_classes.add(matcher_class)
-            matcher = matcher_class(dataset_id=dataset_id, epochs=epochs)
-            if not matcher.scores_exist:
-                future = executor.submit(matcher.find_scores)  # Run matcher in a thread
-                futures.append(future)
 
-        for future in futures:
-            future.result()
+@app.get("/v1/scheduler/")
+def get_scheduler_status():
+    return MatcherScheduler.instance().status()
+
+
+@app.get("/v1/jobs/{job_id}/")
+def get_job(job_id: str):
+    job = JobManager.instance().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job.to_dict()
 
-    return {"successful": True}
+
+@app.websocket("/ws/jobs/{job_id}")
+async def stream_job(websocket: WebSocket, job_id: str):
+    await websocket.accept()
+    manager: JobManager = JobManager.instance()
+    queue = manager.subscribe(job_id, asyncio.get_running_loop())
+    if queue is None:
+        await websocket.send_json({"type": "error", "job_id": job_id, "error": "job not found"})
+        await websocket.close()
+        return
+
+    try:
+        while True:
+            event = await queue.get()
+            await websocket.send_json(event)
+            if event["type"] == "status" and event["matcher"] is None and JobStatus(event["status"]) in FINISHED:
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.unsubscribe(job_id, queue)
 
 
 @app.get("/v1/datasets/{dataset_id}/fairness/")
@@ -157,25 +221,39 @@ async def calculate_fairness_metrics(dataset_id: str,
                                      matching_threshold: float = 0.5,
                                      fairness_threshold: float = 0.2,
                                      group_acceptance_count: int = 1):
-    test_df = pd.read_csv(StandardConvertor(dataset_id=dataset_id, splits=None).test_path)
-    fairness_analyzer = FairnessAnalyzer(sensitive_attribute=sensitive_attribute, test_df=test_df)
+    await run_in_process(ensure_converted, dataset_id, StandardConvertor)
+    test_path = StandardConvertor.get_test_path(dataset_id)
     matcher_algorithms = [eval(f"MatcherAlgorithm.{(m.upper().replace(' ', '_'))}") for m in matchers]
     fairness_metrics = [eval(f"FairnessMeasure.{(m.upper().replace(' ', '_'))}") for m in fairness_metrics]
     disparity_calculation_type = eval(
         f"DisparityCalculationType.{(disparity_calculation_type.upper().replace(' ', '_'))}")
 
     if dataset_id == "dblp":
-        results = {}
+        # identical queries are answered from the cache until test.csv or preds.csv change
+        cache_keys = {}
         for matcher in matcher_algorithms:
             predictor_class: Type[Predictor] = PredictorManager.instance().get_predictor(predictor_name=matcher.value)
-            prediction_df = predictor_class(dataset_id=dataset_id, matching_threshold=matching_threshold).predict()
-            results[matcher.value] = fairness_analyzer(prediction_df=prediction_df,
-                                                       disparity_calculation_type=disparity_calculation_type,
-                                                       measures=fairness_metrics,
-                                                       fairness_threshold=fairness_threshold,
-                                                       group_acceptance_count=group_acceptance_count)
-
-        return results
+            predictor = predictor_class(dataset_id=dataset_id, matching_threshold=matching_threshold)
+            cache_keys[matcher] = fairness_cache.make_key(dataset_id, matcher.value, matching_threshold,
+                                                          sensitive_attribute, [m.value for m in fairness_metrics],
+                                                          disparity_calculation_type.value, fairness_threshold,
+                                                          group_acceptance_count, file_signature(test_path),
+                                                          file_signature(predictor.scores_path))
+        missing = object()
+        cached = await asyncio.gather(*[fairness_cache.get_async(cache_key, missing)
+                                        for cache_key in cache_keys.values()])
+        results = dict(zip(cache_keys, cached))
+
+        # the uncached matchers are evaluated together in one worker process on a shared workload
+        uncached = [matcher for matcher, result in results.items() if result is missing]
+        if uncached:
+            computed = await run_in_process(tasks.calculate_fairness, dataset_id, sensitive_attribute, uncached,
+                                            disparity_calculation_type, fairness_metrics, matching_threshold,
+                                            fairness_threshold, group_acceptance_count)
+            for matcher in uncached:
+                results[matcher] = computed[matcher.value]
+                await fairness_cache.set_async(cache_keys[matcher], results[matcher])
+        return {matcher.value: results[matcher] for matcher in matcher_algorithms}
     else:
 
         with open(f"samples/{dataset_id}.json", 'r+') as f:
@@ -205,54 +283,66 @@ async def calculate_fairness_metrics(dataset_id: str,
         return final_results
 
 
+@app.get("/v1/datasets/{dataset_id}/fairness/sweep/")
+async def calculate_fairness_sweep(dataset_id: str,
+                                   sensitive_attribute: str,
+                                   disparity_calculation_type: str,
+                                   fairness_metrics: List[str] = Query(None),
+                                   matchers: List[str] = Query(None),
+                                   min_matching_threshold: float = 0.0,
+                                   max_matching_threshold: float = 1.0,
+                                   matching_threshold_steps: int = 21,
+                                   fairness_threshold: float = 0.2,
+                                   group_acceptance_count: int = 1):
+    # fairness of every group for a whole grid of matching thresholds, each matcher's
+    # scores are read and bucketed once instead of once per threshold
+    await run_in_process(ensure_converted, dataset_id, StandardConvertor)
+    test_path = StandardConvertor.get_test_path(dataset_id)
+    matcher_algorithms = [eval(f"MatcherAlgorithm.{(m.upper().replace(' ', '_'))}") for m in matchers]
+    fairness_metrics = [eval(f"FairnessMeasure.{(m.upper().replace(' ', '_'))}") for m in fairness_metrics]
+    disparity_calculation_type = eval(
+        f"DisparityCalculationType.{(disparity_calculation_type.upper().replace(' ', '_'))}")
+    matching_thresholds = np.linspace(min_matching_threshold, max_matching_threshold,
+                                      max(matching_threshold_steps, 1)).round(6).tolist()
+
+    async def matcher_sweep(matcher: MatcherAlgorithm):
+        predictor_class: Type[Predictor] = PredictorManager.instance().get_predictor(predictor_name=matcher.value)
+        predictor = predictor_class(dataset_id=dataset_id)
+        cache_key = fairness_cache.make_key("sweep", dataset_id, matcher.value, matching_thresholds,
+                                            sensitive_attribute, [m.value for m in fairness_metrics],
+                                            disparity_calculation_type.value, fairness_threshold,
+                                            group_acceptance_count, file_signature(test_path),
+                                            file_signature(predictor.scores_path))
+        return await fairness_cache.get_or_compute_async(
+            cache_key, lambda: run_in_process(tasks.calculate_fairness_sweep, dataset_id, sensitive_attribute,
+                                              matcher, disparity_calculation_type, fairness_metrics,
+                                              matching_thresholds, fairness_threshold, group_acceptance_count))
+
+    results = await asyncio.gather(*[matcher_sweep(matcher) for matcher in matcher_algorithms])
+    return {matcher.value: result for matcher, result in zip(matcher_algorithms, results)}
+
+
 @app.get("/v1/datasets/{dataset_id}/details/{group}/")
-def get_group_details(dataset_id: str, group: str,
-                      matcher: str,
-                      fairness_metric: str,
-                      sensitive_attribute: str,
-                      matching_threshold: float = 0.5):
-    test_df = pd.read_csv(StandardConvertor(dataset_id=dataset_id, splits=None).test_path)
+async def get_group_details(dataset_id: str, group: str,
+                            matcher: str,
+                            fairness_metric: str,
+                            sensitive_attribute: str,
+                            matching_threshold: float = 0.5):
     matcher_algorithm = eval(f"MatcherAlgorithm.{matcher.upper().replace(' ', '_')}")
     fairness_measure = eval(f"FairnessMeasure.{fairness_metric.upper().replace(' ', '_')}")
 
-    predictor_class: Type[Predictor] = PredictorManager.instance().get_predictor(predictor_name=matcher_algorithm.value)
-    prediction_df = predictor_class(dataset_id=dataset_id, matching_threshold=matching_threshold).predict()
-    performance_analyzer = ExplanationProvider(test_df=test_df, sensitive_attribute=sensitive_attribute)
-    results = performance_analyzer(prediction_df=prediction_df, group=group, fairness_measure=fairness_measure,
-                                   num_samples=6, seed=hash(matcher))
-    return results
+    # the seed is hashed here, string hashes differ between the worker processes
+    return await run_in_process(tasks.explain_group, dataset_id, group, matcher_algorithm, fairness_measure,
+                                sensitive_attribute, matching_threshold, hash(matcher))
 
 
 @app.get("/v1/datasets/{dataset_id}/ensemble/")
-def get_ensemble(dataset_id: str, sensitive_attribute: str,
-                 matchers: List[str] = Query(None),
-                 fairness_metrics: List[str] = Query(None),
-                 matching_threshold: float = 0.5):
-    test_df = pd.read_csv(StandardConvertor(dataset_id=dataset_id, splits=None).test_path)
+async def get_ensemble(dataset_id: str, sensitive_attribute: str,
+                       matchers: List[str] = Query(None),
+                       fairness_metrics: List[str] = Query(None),
+                       matching_threshold: float = 0.5):
     matcher_algorithms = [eval(f"MatcherAlgorithm.{(m.upper().replace(' ', '_'))}") for m in matchers]
     fairness_metrics = [eval(f"FairnessMeasure.{(m.upper().replace(' ', '_'))}") for m in fairness_metrics]
 
-    performance_analyzer = PerformanceAnalyzer(test_df=test_df, sensitive_attribute=sensitive_attribute)
-    ensemble_analyzer = EnsembleAnalyzer(test_df=test_df, sensitive_attribute=sensitive_attribute)
-    tables = {}
-    charts = []
-    for metric in fairness_metrics:
-        non_parity_metric = metric.value.replace("_parity", "")
-        prediction_mappings = {}
-        for matcher in matcher_algorithms:
-            predictor_class: Type[Predictor] = PredictorManager.instance().get_predictor(
-                predictor_name=matcher.value)
-            prediction_df = predictor_class(dataset_id=dataset_id, matching_threshold=matching_threshold).predict()
-            prediction_mappings[matcher.value] = prediction_df
-
-        performance_df = performance_analyzer(prediction_mappings=prediction_mappings, measure=non_parity_metric)
-        tables[non_parity_metric] = performance_df.to_dict(orient="split", index=False)
-        charts.append({
-            "name": non_parity_metric,
-            "xObj": "min",
-            "yObj": "max" if non_parity_metric in ["accuracy", "true_positive_rate", "negative_predictive_value",
-                                                   "positive_predictive_value"] else "min",
-            "data": ensemble_analyzer(df=performance_df)
-        })
-
-    return {"tables": tables, "charts": charts}
+    return await run_in_process(tasks.calculate_ensemble, dataset_id, sensitive_attribute, matcher_algorithms,
+                                fairness_metrics, matching_threshold)
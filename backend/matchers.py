@@ -1,31 +1,149 @@
+import hashlib
 import json
 import os
+import tempfile
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import closing
 from pathlib import Path
-from typing import Type
+from typing import Callable, Iterator, Optional, Type
 
-import docker
+import numpy as np
 import pandas as pd
 
 import convertors
 from enums import MatcherAlgorithm
+from executors import ContainerExecutor, create_executor
+from preprocessing import ensure_converted
+from score_cache import ScoreManifest, hash_directory
 from singleton import Singleton
+from storage import save_df
+from utils import get_ds_path
+
+
+class ScoreParseError(Exception):
+    pass
+
+
+class ScoreStreamParser:
+    """
+    Parses the scores a matcher container prints in its log one line at a
+    time. A score block is opened and closed by ========== marker lines, the
+    closing one holding its title, and has an optional header line followed
+    by one float per line. The floats are written into one preallocated
+    buffer of buffer_size scores, which is spilled to an anonymous temporary
+    file in spill_dir whenever it fills up. A block that fit into the buffer
+    becomes an array of its own, a spilled one a read-only memmap of its file,
+    so neither the log nor a growing list of floats is ever held in memory.
+    """
+
+    MARKER = "=========="
+
+    def __init__(self, buffer_size: int = 1 << 20, spill_dir: Optional[str] = None):
+        self.batches = []
+        self.lines = 0
+        self.buffer_size = buffer_size
+        self.spill_dir = spill_dir
+        self._buffer = None
+        self._filled = 0
+        self._count = 0
+        self._spill = None
+        self._in_block = False
+        self._header_seen = False
+
+    @classmethod
+    def is_marker(cls, line: str) -> bool:
+        return line.startswith(cls.MARKER) and line.endswith(cls.MARKER)
+
+    def feed(self, line: str) -> None:
+        self.lines += 1
+        if self.is_marker(line):
+            if not self._in_block:
+                self._in_block = True
+                self._header_seen = False
+            else:
+                self._in_block = False
+                scores = self._finish_block()
+                if len(scores) > 0:
+                    self.batches.append((line.replace(self.MARKER, ""), scores))
+        elif self._in_block:
+            if not self._header_seen:
+                self._header_seen = True
+                try:
+                    self._append(float(line.strip()))
+                except ValueError:
+                    pass
+            else:
+                try:
+                    self._append(float(line))
+                except ValueError:
+                    self._discard_block()
+                    raise ScoreParseError(f"line {self.lines} of the matcher log is not a score: {line[:80]!r}")
+
+    def close(self) -> None:
+        if self._in_block:
+            count = self._count
+            self._discard_block()
+            raise ScoreParseError(f"the matcher log ended inside a score block after {count} scores")
+
+    def _append(self, value: float) -> None:
+        if self._buffer is None:
+            self._buffer = np.empty(self.buffer_size, dtype=np.float64)
+        self._buffer[self._filled] = value
+        self._filled += 1
+        self._count += 1
+        if self._filled == self.buffer_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(dir=self.spill_dir)
+        self._spill.write(self._buffer[:self._filled].tobytes())
+        self._filled = 0
+
+    def _finish_block(self) -> np.ndarray:
+        if self._spill is None:
+            scores = self._buffer[:self._filled].copy() if self._count else np.empty(0, dtype=np.float64)
+        else:
+            self._flush()
+            self._spill.flush()
+            # the mapping outlives the file, which is removed once it is closed and unmapped
+            scores = np.memmap(self._spill, dtype=np.float64, mode="r", shape=(self._count,))
+        self._discard_block()
+        return scores
+
+    def _discard_block(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self._filled = 0
+        self._count = 0
 
 
 class Matcher(ABC):
+    SCORES_MOUNT = "/app/scores"
+    SCORE_FILE_NAME = "scores.npy"
 
-    def __init__(self, dataset_id: str, epochs: int = 1):
+    # log_listener is called with every line the container prints while docker_run is running
+    def __init__(self, dataset_id: str, epochs: int = 1, executor: Optional[ContainerExecutor] = None,
+                 log_listener: Optional[Callable[[str], None]] = None):
         self.dataset_id = dataset_id
         self.epochs = epochs
-        self.scores = []
-        try:
-            self.client = docker.from_env()
-        except Exception as e:
-            print(f"Exception occured: {e}")
-            pass
-        self.output = None
+        self.scores = np.empty(0, dtype=np.float64)
+        self.score_batches = []
+        self.log_tail = deque()
+        self.run_key = None
+        self._executor = executor
+        self.log_listener = log_listener
         self.__init_dirs__()
 
+    @property
+    def executor(self) -> ContainerExecutor:
+        # created on first use, so building a Matcher does not connect to docker
+        if self._executor is None:
+            self._executor = create_executor()
+        return self._executor
+
     def __init_dirs__(self):
         Path(self.scores_dir).mkdir(parents=True, exist_ok=True)
 
@@ -33,63 +151,98 @@ class Matcher(ABC):
     def find_scores(self):
         pass
 
-    def extract_scores(self) -> iter(list[float], str):
-        def is_float(str):
-            try:
-                float(str)
-                return True
-            except ValueError:
-                return False
-
-        assert self.output is not None
-        in_data = self.output.splitlines()
-        data = []
-        is_results = False
-        is_columns = False
-        data_batch_finished = True
-        title = ""
-
-        for line in in_data:
-            if line.startswith("==========") and line.endswith("=========="):
-                is_results = not is_results
-                data_batch_finished = not data_batch_finished
-                title = str(line).replace("==========", "")
-                if data_batch_finished and len(data) > 0:
-                    yield title, data
-                    data = []
-                    is_columns = False
-
-            elif is_results:
-                if not is_columns:
-                    is_columns = True
-                    if is_float(line.strip()):
-                        data.append(float(line.strip()))
-                else:
-                    data.append(float(line))
-
-        if data_batch_finished and len(data) > 0:
-            yield title, data
+    def extract_scores(self) -> Iterator[tuple[str, np.ndarray]]:
+        # the (title, scores) blocks parsed from the log of the last docker_run
+        if not self.score_batches:
+            raise ScoreParseError("the matcher printed no scores, last log lines:\n" + "\n".join(self.log_tail))
+        yield from self.score_batches
+
+    def prepare_inputs(self) -> None:
+        # the matcher's input format is only written when it is first needed
+        ensure_converted(self.dataset_id, self.get_convertor_class())
+
+    def prepare_run_key(self) -> str:
+        # converts the inputs and takes the key of the scores they lead to, once, before
+        # the run: the containers may write next to their inputs
+        if self.run_key is None:
+            self.prepare_inputs()
+            self.run_key = self.calculate_score_key()
+        return self.run_key
 
     def docker_run(self, envs: dict, volumes: dict):
-        container = self.client.containers.run(
-            image=self.image_name,
-            detach=True,
-            remove=True,
-            stdout=True,
-            stderr=True,
-            environment=envs,
-            volumes=volumes,
-            device_requests=[
-                docker.types.DeviceRequest(device_ids=["all"], capabilities=[['gpu']])]
-        )
-
-        output = container.logs(stdout=True, stderr=True, follow=True).decode()
-        # container.wait()
-        self.output = output
+        # images that support it write their scores as an .npy file to SCORES_FILE in
+        # the mounted scores_dir, older ones print them in the log, which is parsed
+        # as it streams in (only its last lines are kept) and stops the run on the
+        # first malformed score line
+        self.prepare_run_key()
+        score_file = os.path.join(self.scores_dir, self.SCORE_FILE_NAME)
+        if os.path.isfile(score_file):
+            os.remove(score_file)
+        envs = dict(envs, SCORES_FILE=f"{self.SCORES_MOUNT}/{self.SCORE_FILE_NAME}")
+        volumes = dict(volumes, **{os.path.abspath(self.scores_dir): {'bind': self.SCORES_MOUNT, 'mode': 'rw'}})
+
+        parser = ScoreStreamParser()
+        self.log_tail = deque(maxlen=50)
+        with closing(self.executor.run(self.image_name, envs, volumes)) as lines:
+            for line in lines:
+                self.log_tail.append(line)
+                if self.log_listener is not None:
+                    self.log_listener(line)
+                parser.feed(line)
+        parser.close()
+        self.score_batches = parser.batches
+        if os.path.isfile(score_file):
+            scores = np.load(score_file, mmap_mode="r")
+            # like empty score blocks in the log, an empty file holds no scores
+            if scores.size > 0:
+                self.score_batches = [(self.SCORE_FILE_NAME, scores)]
+
+    def save_scores(self):
+        # the scores are written once, as the manifest entry of the run that preds.csv links to
+        title, self.scores = next(self.extract_scores())
+        scores = np.asarray(self.scores, dtype=np.float64).reshape(-1)
+        df = pd.DataFrame({"scores": scores}, copy=False)
+        manifest = ScoreManifest(self.scores_dir)
+        key = self.prepare_run_key()
+        save_df(df, manifest.entry_path(key))
+        manifest.record(key, image=self.image_name, params=self.training_params)
+
+        # the .npy hand-over file is not needed once its scores are persisted
+        self.score_batches = []
+        self.scores = np.empty(0, dtype=np.float64)
+        del df, scores
+        score_file = os.path.join(self.scores_dir, self.SCORE_FILE_NAME)
+        if os.path.isfile(score_file):
+            os.remove(score_file)
 
     @property
-    def scores_exist(self) -> bool:
-        return os.path.isfile(os.path.join(self.scores_dir, "preds.csv"))
+    def training_params(self) -> dict:
+        return {"epochs": self.epochs}
+
+    def calculate_score_key(self) -> str:
+        # scores are only reused for the same preprocessed inputs, image and training parameters
+        key = {"inputs": hash_directory(self.preprocess_dir), "image": self.image_name,
+               "params": self.training_params}
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def restore_cached_scores(self) -> bool:
+        # makes the cached scores for the current inputs the ones in preds.csv, returns False
+        # if there are none. the inputs are converted and run_key is set on the way
+        manifest = ScoreManifest(self.scores_dir)
+        key = self.prepare_run_key()
+        if manifest.exists():
+            return manifest.restore(key)
+        # a preds.csv from before the manifest (e.g. shipped with the app) is only trusted
+        # if the dataset was not uploaded after it, and is then recorded for the current
+        # inputs, so later changes to them are trained for
+        preds_path = os.path.join(self.scores_dir, "preds.csv")
+        ds_path = get_ds_path(self.dataset_id)
+        if not os.path.isfile(preds_path):
+            return False
+        if os.path.isfile(ds_path) and os.path.getmtime(preds_path) < os.path.getmtime(ds_path):
+            return False
+        manifest.adopt(key, image=self.image_name, params=self.training_params)
+        return True
 
     @staticmethod
     @abstractmethod
@@ -101,14 +254,21 @@ class Matcher(ABC):
         manager: MatcherManager = MatcherManager.instance()
         return manager.get_matcher_image(self.get_name())
 
+    @classmethod
+    def get_convertor_class(cls) -> Type[convertors.Convertor]:
+        return convertors.ConvertorManager.get_convertor(cls.get_name())
+
     @property
     def preprocess_dir(self) -> str:
-        dir_name = convertors.ConvertorManager.get_convertor(self.get_name()).get_dir_name()
-        return os.path.join(os.getenv("PREPROCESS_PATH", "./preprocess"), dir_name, self.dataset_id)
+        return self.get_convertor_class().get_output_dir_name(self.dataset_id)
 
     @property
     def scores_dir(self) -> str:
-        return os.path.join(os.getenv("SCORES_PATH", "./scores"), self.get_name(), self.dataset_id)
+        return self.get_scores_dir(self.dataset_id)
+
+    @classmethod
+    def get_scores_dir(cls, dataset_id: str) -> str:
+        return os.path.join(os.getenv("SCORES_PATH", "./scores"), cls.get_name(), dataset_id)
 
 
 class DeepMatcher(Matcher):
@@ -117,10 +277,7 @@ class DeepMatcher(Matcher):
             volumes={os.getenv("FASTTEXT_PATH", "./fasttext"): {'bind': '/root/.vector_cache', 'mode': 'rw'},
                      self.preprocess_dir: {'bind': f'/app/deepmatcher/data/{self.dataset_id}/', 'mode': 'rw'}},
             envs={"TASK": self.dataset_id, "EPOCHS": self.epochs})
-
-        title, self.scores = next(self.extract_scores())
-        df = pd.DataFrame(self.scores, columns=["scores"])
-        df.to_csv(os.path.join(self.scores_dir, "preds.csv"), index=False)
+        self.save_scores()
 
     @staticmethod
     def get_name() -> str:
@@ -133,10 +290,7 @@ class HierMatcher(Matcher):
             volumes={os.getenv("FASTTEXT_PATH", "./fasttext/"): {'bind': '/app/HierMatcher/embedding/', 'mode': 'rw'},
                      self.preprocess_dir: {'bind': f'/app/HierMatcher/data/{self.dataset_id}/', 'mode': 'rw'}},
             envs={"TASK": self.dataset_id, "EPOCHS": self.epochs})
-
-        title, self.scores = next(self.extract_scores())
-        df = pd.DataFrame(self.scores, columns=["scores"])
-        df.to_csv(os.path.join(self.scores_dir, "preds.csv"), index=False)
+        self.save_scores()
 
     @staticmethod
     def get_name() -> str:
@@ -150,10 +304,7 @@ class MCANMatcher(Matcher):
                 os.getenv("FASTTEXT_PATH", "./fasttext/"): {'bind': '/app/MCAN/embedding/', 'mode': 'rw'},
                 self.preprocess_dir: {'bind': f'/app/MCAN/data/Structural/{self.dataset_id}/', 'mode': 'rw'}},
             envs={"TASK": self.dataset_id, "EPOCHS": self.epochs})
-
-        title, self.scores = next(self.extract_scores())
-        df = pd.DataFrame(self.scores, columns=["scores"])
-        df.to_csv(os.path.join(self.scores_dir, "preds.csv"), index=False)
+        self.save_scores()
 
     @staticmethod
     def get_name() -> str:
@@ -165,10 +316,7 @@ class DittoMatcher(Matcher):
         self.docker_run(
             volumes={self.preprocess_dir: {'bind': f'/app/ditto/data/{self.dataset_id}/', 'mode': 'rw'}},
             envs={"TASK": self.dataset_id, "EPOCHS": self.epochs})
-
-        title, self.scores = next(self.extract_scores())
-        df = pd.DataFrame(self.scores, columns=["scores"])
-        df.to_csv(os.path.join(self.scores_dir, "preds.csv"), index=False)
+        self.save_scores()
 
     @staticmethod
     def get_name() -> str:
@@ -181,15 +329,15 @@ class NonNeuralMatcher(Matcher, ABC):
         self.docker_run(
             volumes={self.preprocess_dir: {'bind': f'/app/non-neural/data/{self.dataset_id}/', 'mode': 'rw'}},
             envs={"TASK": self.dataset_id, "MODEL": self.get_name()})
-
-        title, self.scores = next(self.extract_scores())
-        df = pd.DataFrame(self.scores, columns=["scores"])
-        df.to_csv(os.path.join(self.scores_dir, "preds.csv"), index=False)
+        self.save_scores()
 
     @property
-    def preprocess_dir(self) -> str:
-        dir_name = convertors.ConvertorManager.get_convertor(MatcherAlgorithm.NONNEURAL.value).get_dir_name()
-        return os.path.join(os.getenv("PREPROCESS_PATH", "./preprocess"), dir_name, self.dataset_id)
+    def training_params(self) -> dict:
+        return {"model": self.get_name()}
+
+    @classmethod
+    def get_convertor_class(cls) -> Type[convertors.Convertor]:
+        return convertors.ConvertorManager.get_convertor(MatcherAlgorithm.NONNEURAL.value)
 
     @property
     def image_name(self) -> str:
@@ -237,6 +385,7 @@ class NaiveBayesMatcher(NonNeuralMatcher):
 class MatcherManager:
     def __init__(self):
         self.matchers = self.__init_matchers__()
+        self.scheduler_config = self.__init_scheduler_config__()
         self.mappings = self.__init_mappings__()
 
     @staticmethod
@@ -260,6 +409,12 @@ class MatcherManager:
             config = json.load(f)
             return config["matchers"]
 
+    @staticmethod
+    def __init_scheduler_config__():
+        with open(os.getenv("CONFIG_PATH", "./config.json"), 'r+') as f:
+            config = json.load(f)
+            return config.get("scheduler", {})
+
     def get_matcher(self, matcher_name: str) -> Type[Matcher]:
         return self.mappings[MatcherAlgorithm(matcher_name.strip())]
 
@@ -2,11 +2,13 @@ import os.path
 from abc import ABC, abstractmethod
 from typing import Type
 
+import numpy as np
 import pandas as pd
 
 from enums import MatcherAlgorithm
 from matchers import MatcherManager, Matcher
 from singleton import Singleton
+from storage import load_df
 
 
 class Predictor(ABC):
@@ -25,12 +27,17 @@ class Predictor(ABC):
 
     @property
     def scores_dir(self) -> str:
+        # resolved on the class, instantiating a Matcher would create a docker client
         matcher_class: Type[Matcher] = MatcherManager.instance().get_matcher(self.get_name())
-        return matcher_class(dataset_id=self.dataset_id).scores_dir
+        return matcher_class.get_scores_dir(self.dataset_id)
+
+    @property
+    def scores_path(self) -> str:
+        return os.path.join(self.scores_dir, "preds.csv")
 
     @property
     def df(self):
-        df = pd.read_csv(os.path.join(self.scores_dir, "preds.csv"))
+        df = load_df(self.scores_path, columns=["scores"])
         return df
 
 
@@ -40,6 +47,11 @@ class StandardPredictor(Predictor, ABC):
             'preds': (self.df['scores'] > self.matching_threshold).astype(int)
         })
 
+    def scores(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            'scores': self.df['scores']
+        })
+
 
 class DittoPredictor(StandardPredictor):
     @staticmethod
@@ -123,3 +135,15 @@ class PredictorManager:
 
     def get_predictor(self, predictor_name: str) -> Type[Predictor]:
         return self._mappings[MatcherAlgorithm(predictor_name.strip())]
+
+    def predict_matrix(self, dataset_id: str, predictor_names: list[str],
+                       matching_threshold: float = 0.5) -> pd.DataFrame:
+        # the (rows x matchers) predictions of several matchers, each one's scores read
+        # once, aligned on the row index and thresholded together. rows a matcher has
+        # no score for are NaN
+        scores = pd.concat([self.get_predictor(name)(dataset_id=dataset_id).df["scores"].rename(name)
+                            for name in predictor_names], axis=1)
+        values = scores.to_numpy(dtype=float)
+        with np.errstate(invalid="ignore"):
+            preds = np.where(np.isnan(values), np.nan, values > matching_threshold)
+        return pd.DataFrame(preds, index=scores.index, columns=scores.columns)
@@ -0,0 +1,89 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Type
+
+import pandas as pd
+
+from convertors import split, Convertor, ConvertorManager, StandardConvertor
+from score_cache import hash_file
+from storage import load_df
+from utils import get_ds_path, load_dataset_as_df
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_conversion_locks = {}
+_conversion_locks_lock = threading.Lock()
+
+
+def source_hash(dataset_id: str) -> str:
+    return hash_file(get_ds_path(dataset_id))
+
+
+@contextmanager
+def conversion_lock(dataset_id: str, convertor_class: Type[Convertor]):
+    # held while a format of a dataset is written, across the threads of this process
+    # and, where flock is available, across the worker processes
+    key = (dataset_id, convertor_class)
+    with _conversion_locks_lock:
+        lock = _conversion_locks.setdefault(key, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        output_dir = convertor_class.get_output_dir_name(dataset_id)
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        with open(os.path.join(output_dir, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# converts the dataset with every convertor whose outputs were not written from the
+# current upload yet, in parallel on the same splits, and returns the converted ones
+def preprocess(dataset_id: str, convertor_classes: Optional[list[Type[Convertor]]] = None,
+               max_workers: int = None) -> list[Type[Convertor]]:
+    convertor_classes = list(dict.fromkeys(convertor_classes or ConvertorManager.get_all_convertors()))
+    digest = source_hash(dataset_id)
+    stale = [convertor_class for convertor_class in convertor_classes
+             if not convertor_class.is_converted(dataset_id, digest)]
+    if not stale:
+        return []
+
+    splits = split(load_dataset_as_df(dataset_id))
+
+    def convert(convertor_class: Type[Convertor]) -> bool:
+        with conversion_lock(dataset_id, convertor_class):
+            # another request may have written the format while this one waited
+            if convertor_class.is_converted(dataset_id, digest):
+                return False
+            convertor = convertor_class(dataset_id=dataset_id, splits=splits)
+            convertor.convert()
+            convertor.mark_converted(digest)
+            return True
+
+    max_workers = max_workers or int(os.getenv("PREPROCESS_THREADS", len(stale)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() re-raises the first failed conversion
+        converted = list(executor.map(convert, stale))
+    return [convertor_class for convertor_class, done in zip(stale, converted) if done]
+
+
+def ensure_converted(dataset_id: str, convertor_class: Type[Convertor]) -> bool:
+    # outputs without their uploaded dataset (e.g. shipped with the app) are used as they are
+    if not os.path.isfile(get_ds_path(dataset_id)):
+        return False
+    return bool(preprocess(dataset_id, [convertor_class]))
+
+
+def load_test_df(dataset_id: str, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    # the test split in the uploaded columns, which the predictions are aligned with
+    ensure_converted(dataset_id, StandardConvertor)
+    return load_df(StandardConvertor.get_test_path(dataset_id), columns=columns)
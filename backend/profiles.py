@@ -0,0 +1,92 @@
+import json
+import os
+from collections import Counter
+from typing import Iterable
+
+import pandas as pd
+
+
+def column_warnings(columns: Iterable[str]) -> list[str]:
+    # an entity matching candidate set has a label and matching left_/right_ columns,
+    # datasets that are not one are still accepted but cannot be matched or evaluated
+    columns = [str(c) for c in columns]
+    warnings = []
+    if "label" not in columns:
+        warnings.append("the dataset has no label column")
+    left = {c.replace("left_", "", 1) for c in columns if c.startswith("left_")}
+    right = {c.replace("right_", "", 1) for c in columns if c.startswith("right_")}
+    if not left and not right:
+        warnings.append("the dataset has no left_ and right_ columns")
+    elif left != right:
+        missing = sorted(left.symmetric_difference(right))
+        warnings.append(f"the left_ and right_ columns do not match: {', '.join(missing)}")
+    return warnings
+
+
+class DatasetProfiler:
+    """
+    Accumulates the row count and the value frequencies of the left_/right_
+    columns of a dataset one chunk at a time, so datasets that do not fit in
+    memory can be profiled. Columns with more than max_distinct values are
+    not candidate sensitive attributes and stop being tracked. Columns and
+    labels that do not make a candidate set are reported as warnings.
+    """
+
+    def __init__(self, max_distinct: int = 1000):
+        self.max_distinct = max_distinct
+        self.columns = None
+        self.rows = 0
+        self.frequencies = {}
+        self.warnings = []
+        self.invalid_labels = 0
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        if self.columns is None:
+            self.columns = [str(c) for c in chunk.columns]
+            self.warnings = column_warnings(self.columns)
+            self.frequencies = {c: Counter() for c in self.columns if c.startswith(("left_", "right_"))}
+        if "label" in chunk.columns:
+            self.invalid_labels += int((~chunk["label"].isin([0, 1])).sum())
+
+        self.rows += len(chunk)
+        for column in list(self.frequencies):
+            counts = chunk[column].value_counts()
+            self.frequencies[column].update(dict(zip(counts.index.tolist(), counts.tolist())))
+            if len(self.frequencies[column]) > self.max_distinct:
+                del self.frequencies[column]
+
+    def result(self) -> dict:
+        # frequencies are [value, count] pairs so non-string values survive JSON
+        warnings = list(self.warnings)
+        if self.invalid_labels:
+            warnings.append(f"{self.invalid_labels} rows have a label other than 0 or 1")
+        return {
+            "columns": self.columns or [],
+            "rows": self.rows,
+            "warnings": warnings,
+            "frequencies": {
+                column: sorted(([value, count] for value, count in counter.items()), key=lambda p: str(p[0]))
+                for column, counter in self.frequencies.items()
+            },
+        }
+
+
+def profile_csv(path: str, chunksize: int = 100_000, max_distinct: int = 1000) -> dict:
+    profiler = DatasetProfiler(max_distinct=max_distinct)
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        profiler.update(chunk)
+    if profiler.columns is None:
+        raise ValueError("the dataset is empty")
+    return profiler.result()
+
+
+def save_profile(path: str, profile: dict) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f)
+    os.replace(tmp_path, path)
+
+
+def load_profile(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
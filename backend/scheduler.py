@@ -0,0 +1,122 @@
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+from matchers import MatcherManager
+from singleton import Singleton
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+class ScheduledRun:
+    def __init__(self, key: Hashable, image: str, run: Callable[[Callable[[str], None]], Any], priority: int):
+        self.key = key
+        self.image = image
+        self.run = run
+        self.priority = priority
+        self.future = Future()
+        self.start_listeners = []
+        self.log_listeners = []
+        self.started = False
+
+    def log(self, line: str) -> None:
+        for listener in list(self.log_listeners):
+            listener(line)
+
+
+@Singleton
+class MatcherScheduler:
+    """
+    Admits matcher runs to the host. At most max_concurrent runs execute at
+    once, and at most max_concurrent of each image's matcher entry in
+    config.json. Waiting runs are started by priority (lower first), FIFO
+    within a priority, skipping runs whose image is at its limit. A run with
+    the key of a queued or running one is not started again: the caller
+    shares its future and receives its log lines. Once max_queued runs are
+    waiting, new runs are rejected with SchedulerFull.
+    """
+
+    def __init__(self):
+        manager: MatcherManager = MatcherManager.instance()
+        config = manager.scheduler_config
+        self.max_concurrent = int(config.get("max_concurrent", 2))
+        self.max_queued = int(config.get("max_queued", 64))
+        self.image_limits = {m["image"]: int(m.get("max_concurrent", 1)) for m in manager.matchers}
+        self._queue = []
+        self._counter = itertools.count()
+        self._in_flight = {}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent)
+
+    def submit(self, key: Hashable, image: str, run: Callable[[Callable[[str], None]], Any], priority: int = 0,
+               on_start: Optional[Callable[[], None]] = None,
+               on_log: Optional[Callable[[str], None]] = None) -> Future:
+        with self._lock:
+            scheduled = self._in_flight.get(key)
+            if scheduled is None:
+                if len(self._queue) >= self.max_queued:
+                    raise SchedulerFull(f"{len(self._queue)} matcher runs are already waiting, try again later.")
+                scheduled = ScheduledRun(key=key, image=image, run=run, priority=priority)
+                self._in_flight[key] = scheduled
+                heapq.heappush(self._queue, (priority, next(self._counter), scheduled))
+            if on_log is not None:
+                scheduled.log_listeners.append(on_log)
+            started = scheduled.started
+            if on_start is not None and not started:
+                scheduled.start_listeners.append(on_start)
+        if on_start is not None and started:
+            on_start()
+        self._dispatch()
+        return scheduled.future
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": {image: count for image, count in self._running.items() if count},
+                "queued": len(self._queue),
+            }
+
+    def _has_capacity(self, image: str) -> bool:
+        return self._running.get(image, 0) < self.image_limits.get(image, 1)
+
+    def _dispatch(self) -> None:
+        to_start = []
+        with self._lock:
+            skipped = []
+            while self._queue and sum(self._running.values()) < self.max_concurrent:
+                entry = heapq.heappop(self._queue)
+                scheduled = entry[2]
+                if self._has_capacity(scheduled.image):
+                    self._running[scheduled.image] = self._running.get(scheduled.image, 0) + 1
+                    scheduled.started = True
+                    to_start.append(scheduled)
+                else:
+                    skipped.append(entry)
+            for entry in skipped:
+                heapq.heappush(self._queue, entry)
+        for scheduled in to_start:
+            self._executor.submit(self._execute, scheduled)
+
+    def _execute(self, scheduled: ScheduledRun) -> None:
+        try:
+            for listener in scheduled.start_listeners:
+                listener()
+            result = scheduled.run(scheduled.log)
+        except Exception as e:
+            self._finish(scheduled)
+            scheduled.future.set_exception(e)
+        else:
+            self._finish(scheduled)
+            scheduled.future.set_result(result)
+        self._dispatch()
+
+    def _finish(self, scheduled: ScheduledRun) -> None:
+        with self._lock:
+            self._running[scheduled.image] -= 1
+            self._in_flight.pop(scheduled.key, None)
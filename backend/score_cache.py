@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from cache import file_signature
+from storage import parquet_path
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+_manifest_lock = threading.Lock()
+
+
+def hash_file(path: str) -> str:
+    # content hashes are remembered per file signature, unchanged files are not reread
+    signature = file_signature(path)
+    with _file_hashes_lock:
+        if signature in _file_hashes:
+            return _file_hashes[signature]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    with _file_hashes_lock:
+        _file_hashes[signature] = digest.hexdigest()
+    return _file_hashes[signature]
+
+
+def hash_directory(path: str, suffixes: tuple = (".csv", ".txt")) -> str:
+    # hash of the names and contents of the convertor outputs directly in path, files
+    # the matchers cache next to them and Parquet copies are left out
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, name)
+            if os.path.isfile(file_path) and name.endswith(suffixes):
+                digest.update(name.encode())
+                digest.update(hash_file(file_path).encode())
+    return digest.hexdigest()
+
+
+class ScoreManifest:
+    """
+    The manifest.json of a matcher's scores_dir. Every score file a matcher
+    produced is kept as <key>.csv, where the key hashes the preprocessed
+    inputs, the image and the training parameters, and preds.csv is a hard
+    link to the entry marked current (a copy where the filesystem has no
+    hard links), so the scores are stored once. Scores for a key seen before
+    are restored without retraining. SCORE_CACHE_ENTRIES bounds the number
+    of entries kept, not their size on disk.
+    """
+
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, scores_dir: str, max_entries: int = None):
+        self.scores_dir = scores_dir
+        self.max_entries = max_entries or int(os.getenv("SCORE_CACHE_ENTRIES", 8))
+        self.path = os.path.join(scores_dir, self.FILE_NAME)
+        self.preds_path = os.path.join(scores_dir, "preds.csv")
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def load(self) -> dict:
+        if not self.exists():
+            return {"current": None, "entries": {}}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def save(self, manifest: dict) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.scores_dir, f"{key}.csv")
+
+    # makes the scores of key current, returns False if there are none
+    def restore(self, key: str) -> bool:
+        with _manifest_lock:
+            return self._restore(key)
+
+    def _restore(self, key: str) -> bool:
+        manifest = self.load()
+        if manifest["current"] == key and os.path.isfile(self.preds_path):
+            return True
+        if key not in manifest["entries"] or not os.path.isfile(self.entry_path(key)):
+            return False
+        self._make_current(key)
+        manifest["current"] = key
+        manifest["entries"][key]["used_at"] = time.time()
+        self.save(manifest)
+        return True
+
+    # records the scores just written to entry_path(key) and makes them current
+    def record(self, key: str, **metadata) -> None:
+        with _manifest_lock:
+            self._record(key, **metadata)
+
+    def _record(self, key: str, **metadata) -> None:
+        manifest = self.load()
+        self._make_current(key)
+        manifest["entries"][key] = dict(metadata, created_at=time.time(), used_at=time.time())
+        manifest["current"] = key
+
+        stale = sorted(manifest["entries"], key=lambda k: manifest["entries"][k]["used_at"])
+        for old_key in stale[:max(len(stale) - self.max_entries, 0)]:
+            del manifest["entries"][old_key]
+            for path in (self.entry_path(old_key), parquet_path(self.entry_path(old_key))):
+                if os.path.isfile(path):
+                    os.remove(path)
+        self.save(manifest)
+
+    # records the current preds.csv, written before there was a manifest, as the scores of key
+    def adopt(self, key: str, **metadata) -> None:
+        with _manifest_lock:
+            for source, target in ((self.preds_path, self.entry_path(key)),
+                                   (parquet_path(self.preds_path), parquet_path(self.entry_path(key)))):
+                if os.path.isfile(source):
+                    self._link(source, target)
+            self._record(key, **metadata)
+
+    def _make_current(self, key: str) -> None:
+        # preds.csv (and its Parquet copy) are swapped atomically, readers never miss them
+        for source, target in ((self.entry_path(key), self.preds_path),
+                               (parquet_path(self.entry_path(key)), parquet_path(self.preds_path))):
+            if not os.path.isfile(source):
+                if os.path.isfile(target):
+                    os.remove(target)
+                continue
+            self._link(source, target)
+
+    @staticmethod
+    def _link(source: str, target: str) -> None:
+        # target is replaced atomically by a hard link to source, or a copy where links are unsupported
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
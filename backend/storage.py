@@ -0,0 +1,76 @@
+import os
+from typing import Optional
+
+import pandas as pd
+
+from cache import dataframe_cache
+
+try:
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa_csv = None
+    pq = None
+
+
+# frames are always written as CSV, which the matcher containers read, and with
+# STORAGE_FORMAT=parquet also as a Parquet file next to it that readers prefer
+def storage_format() -> str:
+    storage = os.getenv("STORAGE_FORMAT", "csv").strip().lower()
+    if storage == "parquet" and pq is None:
+        print("Exception occured: STORAGE_FORMAT=parquet requires pyarrow, falling back to csv")
+        return "csv"
+    return storage
+
+
+def parquet_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def save_df(df: pd.DataFrame, csv_path: str) -> None:
+    df.to_csv(csv_path, index=False)
+    if storage_format() == "parquet":
+        df.to_parquet(parquet_path(csv_path), index=False)
+    elif os.path.isfile(parquet_path(csv_path)):
+        # a stale Parquet copy would shadow the new CSV
+        os.remove(parquet_path(csv_path))
+
+
+# brings the Parquet copy of a CSV written in some other way (e.g. streamed to
+# disk) up to date, converting it batch by batch instead of loading it whole
+def sync_parquet(csv_path: str) -> None:
+    path = parquet_path(csv_path)
+    if storage_format() != "parquet":
+        if os.path.isfile(path):
+            os.remove(path)
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        reader = pa_csv.open_csv(csv_path)
+        with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Exception occured: {e}")
+        for stale in (tmp_path, path):
+            if os.path.isfile(stale):
+                os.remove(stale)
+
+
+def read_parquet(path: str, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def read_csv(path: str, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    return pd.read_csv(path, usecols=columns)
+
+
+# reads the frame saved at csv_path, from its Parquet copy (memory-mapped) when it
+# is at least as new as the CSV. columns projects the read to the given columns
+def load_df(csv_path: str, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    path = parquet_path(csv_path)
+    if pq is not None and os.path.isfile(path) and (
+            not os.path.isfile(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path)):
+        return dataframe_cache.load(path, read_parquet, columns=columns)
+    return dataframe_cache.load(csv_path, read_csv, columns=columns)
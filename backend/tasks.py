@@ -0,0 +1,94 @@
+from typing import Type
+
+from convertors import Convertor
+from enums import DisparityCalculationType, FairnessMeasure, MatcherAlgorithm
+from fairness.analyzer import FairnessAnalyzer, FairnessSweepAnalyzer, ExplanationProvider, PerformanceAnalyzer, \
+    EnsembleAnalyzer
+from predictors import PredictorManager, Predictor
+from preprocessing import load_test_df, preprocess
+from utils import load_dataset_profile
+
+
+# the CPU-bound work behind the endpoints, as top-level functions so it can be
+# dispatched to the worker processes
+
+
+def fairness_columns(sensitive_attribute: str) -> list[str]:
+    # the only test split columns the fairness workloads read
+    return ["label", f"left_{sensitive_attribute}", f"right_{sensitive_attribute}"]
+
+
+def preprocess_dataset(dataset_id: str, convertor_classes: list[Type[Convertor]]) -> None:
+    load_dataset_profile(dataset_id)
+    preprocess(dataset_id, convertor_classes)
+
+
+def calculate_fairness(dataset_id: str, sensitive_attribute: str, matchers: list[MatcherAlgorithm],
+                       disparity_calculation_type: DisparityCalculationType, measures: list[FairnessMeasure],
+                       matching_threshold: float, fairness_threshold: float, group_acceptance_count: int) -> dict:
+    # the matchers share one workload of the test split, only their confusion counts differ
+    test_df = load_test_df(dataset_id, columns=fairness_columns(sensitive_attribute))
+    prediction_mappings = {}
+    for matcher in matchers:
+        predictor_class: Type[Predictor] = PredictorManager.instance().get_predictor(predictor_name=matcher.value)
+        prediction_mappings[matcher.value] = predictor_class(dataset_id=dataset_id,
+                                                             matching_threshold=matching_threshold).predict()
+    fairness_analyzer = FairnessAnalyzer(sensitive_attribute=sensitive_attribute, test_df=test_df)
+    return fairness_analyzer.batch(prediction_mappings=prediction_mappings,
+                                   disparity_calculation_type=disparity_calculation_type,
+                                   measures=measures,
+                                   fairness_threshold=fairness_threshold,
+                                   group_acceptance_count=group_acceptance_count)
+
+
+def calculate_fairness_sweep(dataset_id: str, sensitive_attribute: str, matcher: MatcherAlgorithm,
+                             disparity_calculation_type: DisparityCalculationType, measures: list[FairnessMeasure],
+                             matching_thresholds: list[float], fairness_threshold: float,
+                             group_acceptance_count: int) -> dict:
+    test_df = load_test_df(dataset_id, columns=fairness_columns(sensitive_attribute))
+    predictor_class: Type[Predictor] = PredictorManager.instance().get_predictor(predictor_name=matcher.value)
+    predictor = predictor_class(dataset_id=dataset_id)
+    fairness_sweep_analyzer = FairnessSweepAnalyzer(sensitive_attribute=sensitive_attribute, test_df=test_df)
+    return fairness_sweep_analyzer(scores_df=predictor.scores(),
+                                   matching_thresholds=matching_thresholds,
+                                   disparity_calculation_type=disparity_calculation_type,
+                                   measures=measures,
+                                   fairness_threshold=fairness_threshold,
+                                   group_acceptance_count=group_acceptance_count)
+
+
+def explain_group(dataset_id: str, group: str, matcher: MatcherAlgorithm, fairness_measure: FairnessMeasure,
+                  sensitive_attribute: str, matching_threshold: float, seed: int) -> dict:
+    test_df = load_test_df(dataset_id)
+    predictor_class: Type[Predictor] = PredictorManager.instance().get_predictor(predictor_name=matcher.value)
+    prediction_df = predictor_class(dataset_id=dataset_id, matching_threshold=matching_threshold).predict()
+    performance_analyzer = ExplanationProvider(test_df=test_df, sensitive_attribute=sensitive_attribute)
+    return performance_analyzer(prediction_df=prediction_df, group=group, fairness_measure=fairness_measure,
+                                num_samples=6, seed=seed)
+
+
+def calculate_ensemble(dataset_id: str, sensitive_attribute: str, matchers: list[MatcherAlgorithm],
+                       measures: list[FairnessMeasure], matching_threshold: float) -> dict:
+    test_df = load_test_df(dataset_id, columns=["label", f"left_{sensitive_attribute}"])
+    performance_analyzer = PerformanceAnalyzer(test_df=test_df, sensitive_attribute=sensitive_attribute)
+    ensemble_analyzer = EnsembleAnalyzer(test_df=test_df, sensitive_attribute=sensitive_attribute)
+    # every matcher is predicted once and all metrics are derived from the same counts
+    preds = PredictorManager.instance().predict_matrix(dataset_id, list(dict.fromkeys(m.value for m in matchers)),
+                                                       matching_threshold=matching_threshold)
+    non_parity_metrics = [metric.value.replace("_parity", "") for metric in measures]
+    performance_tables = performance_analyzer.performance_tables(preds, non_parity_metrics)
+    tables = {}
+    charts = []
+    for non_parity_metric in non_parity_metrics:
+        performance_df = performance_tables[non_parity_metric]
+        tables[non_parity_metric] = performance_df.to_dict(orient="split", index=False)
+        objective = "max" if non_parity_metric in ["accuracy", "true_positive_rate", "negative_predictive_value",
+                                                   "positive_predictive_value"] else "min"
+        charts.append({
+            "name": non_parity_metric,
+            "xObj": "min",
+            "yObj": objective,
+            "data": ensemble_analyzer(df=performance_df, objective=objective)
+        })
+
+    return {"tables": tables, "charts": charts}
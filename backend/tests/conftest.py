@@ -0,0 +1,33 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# a small synthetic candidate set in the shape of dblp, with a multi-valued authors column
+PAIRS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pairs.csv")
+sys.path.insert(0, BACKEND_DIR)
+
+from jobs import JobManager  # noqa: E402
+from scheduler import MatcherScheduler  # noqa: E402
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # the pairs dataset is uploaded to tmp_path, where the preprocessed inputs and scores
+    # go too, the matchers run with the LocalExecutor and the singletons are created anew
+    # for every test
+    for name in ("datasets", "preprocess", "scores"):
+        (tmp_path / name).mkdir()
+    shutil.copy(PAIRS_CSV, tmp_path / "datasets" / "pairs.csv")
+    monkeypatch.chdir(BACKEND_DIR)
+    monkeypatch.setenv("DATASET_UPLOAD_PATH", str(tmp_path / "datasets"))
+    monkeypatch.setenv("PREPROCESS_PATH", str(tmp_path / "preprocess"))
+    monkeypatch.setenv("SCORES_PATH", str(tmp_path / "scores"))
+    monkeypatch.setenv("CONFIG_PATH", os.path.join(BACKEND_DIR, "config.json"))
+    monkeypatch.setenv("MATCHER_EXECUTOR", "local")
+    monkeypatch.setenv("LOCAL_EXECUTOR_EPOCH_SECONDS", "0")
+    monkeypatch.delattr(MatcherScheduler, "_instance", raising=False)
+    monkeypatch.delattr(JobManager, "_instance", raising=False)
+    return tmp_path
@@ -0,0 +1,41 @@
+import os
+
+import pandas as pd
+
+from cache import DataFrameCache
+
+
+def write_csv(path, rows: int) -> str:
+    pd.DataFrame({"scores": [i / rows for i in range(rows)]}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_frames_are_cached_until_their_file_changes(tmp_path):
+    cache = DataFrameCache(max_bytes=1024 * 1024)
+    path = write_csv(tmp_path / "preds.csv", 10)
+    reads = []
+
+    def reader(path, **kwargs):
+        reads.append(path)
+        return pd.read_csv(path, **kwargs)
+
+    cache.load(path, reader)
+    cache.load(path, reader)
+    assert len(reads) == 1
+
+    write_csv(path, 20)
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10 ** 9,) * 2)
+    assert len(cache.load(path, reader)) == 20
+    assert len(reads) == 2
+
+
+def test_frames_larger_than_the_cache_are_not_kept(tmp_path):
+    small = write_csv(tmp_path / "small.csv", 10)
+    large = write_csv(tmp_path / "large.csv", 10_000)
+    cache = DataFrameCache(max_bytes=4096)
+
+    cache.read_csv(small)
+    assert len(cache.read_csv(large)) == 10_000
+
+    assert cache._size <= cache.max_bytes
+    assert [key[0] for key in cache._entries] == [os.path.abspath(small)]
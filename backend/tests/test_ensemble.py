@@ -0,0 +1,102 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fairness.analyzer import EnsembleAnalyzer
+from fairness.ensemble import EnsembleEngine
+
+
+def random_matrix(rng, with_nan: bool) -> np.ndarray:
+    # multiples of 1/8 are exact, so equal disparities compare equal
+    matrix = rng.integers(0, 8, size=(rng.integers(1, 5), rng.integers(1, 5))) / 8
+    if with_nan:
+        matrix[rng.random(matrix.shape) < 0.2] = np.nan
+    return matrix
+
+
+def brute_force_frontier(matrix: np.ndarray, objective: str) -> set:
+    # the (performance, disparity) of every assignment no other one matches or beats on both
+    sign = 1 if objective == "max" else -1
+    points = set()
+    for rows in itertools.product(range(matrix.shape[0]), repeat=matrix.shape[1]):
+        values = matrix[list(rows), np.arange(matrix.shape[1])]
+        if not np.isnan(values).any():
+            points.add((values.min(), values.max() - values.min()))
+    return {
+        (performance, disparity) for performance, disparity in points
+        if not any(sign * other_performance >= sign * performance and other_disparity <= disparity
+                   and (other_performance, other_disparity) != (performance, disparity)
+                   for other_performance, other_disparity in points)
+    }
+
+
+def as_frame(matrix: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame(matrix, columns=[f"group {g}" for g in range(matrix.shape[1])]).astype(object)
+    df = df.where(~np.isnan(matrix), "-")
+    df.insert(0, "matcher", [f"matcher {m}" for m in range(matrix.shape[0])])
+    return df
+
+
+@pytest.mark.parametrize("objective", ["max", "min"])
+def test_pareto_frontier_matches_brute_force(objective):
+    rng = np.random.default_rng(0)
+    for trial in range(200):
+        matrix = random_matrix(rng, with_nan=trial % 3 == 0)
+        engine = EnsembleEngine(matrix, [f"m{m}" for m in range(matrix.shape[0])],
+                                [f"g{g}" for g in range(matrix.shape[1])])
+
+        frontier = engine.pareto_frontier(objective=objective)
+
+        assert {(e["performance"], e["disparity"]) for e in frontier} == brute_force_frontier(matrix, objective)
+        for ensemble in frontier:
+            rows = [engine.matchers.index(ensemble["matchers"][group]) for group in engine.groups]
+            values = matrix[rows, np.arange(matrix.shape[1])]
+            assert ensemble["performance"] == values.min()
+            assert ensemble["disparity"] == values.max() - values.min()
+
+
+@pytest.mark.parametrize("objective", ["max", "min"])
+def test_analyzer_flags_the_frontier_the_chart_draws(objective):
+    rng = np.random.default_rng(1)
+    sign = 1 if objective == "max" else -1
+    for trial in range(100):
+        matrix = random_matrix(rng, with_nan=trial % 3 == 0)
+        ensembles = EnsembleAnalyzer(None, None)(as_frame(matrix), objective=objective, max_combinations=10 ** 6)
+
+        # the chart's test: no other ensemble is better on both axes
+        for ensemble in ensembles:
+            dominated = any(sign * other["performance"] > sign * ensemble["performance"]
+                            and other["disparity"] < ensemble["disparity"] for other in ensembles)
+            assert ensemble["frontier"] == (not dominated)
+
+
+def test_capped_analyzer_still_returns_the_whole_frontier():
+    rng = np.random.default_rng(2)
+    matrix = rng.integers(0, 8, size=(4, 5)) / 8
+    ensembles = EnsembleAnalyzer(None, None)(as_frame(matrix), objective="max", max_combinations=10)
+
+    assert len(ensembles) >= 10
+    flagged = {(e["performance"], e["disparity"]) for e in ensembles if e["frontier"]}
+    assert brute_force_frontier(matrix, "max") <= flagged
+
+
+def test_enumeration_only_walks_valid_assignments():
+    rng = np.random.default_rng(3)
+    matrix = rng.integers(0, 8, size=(4, 3)) / 8
+    matrix[[0, 2], 1] = np.nan
+    engine = EnsembleEngine(matrix, [f"m{m}" for m in range(4)], ["a", "b", "c"])
+
+    expected = [rows for rows in itertools.product(range(4), repeat=3)
+                if not np.isnan(matrix[list(rows), [0, 1, 2]]).any()]
+    listed = [tuple(engine.matchers.index(e["matchers"][g]) for g in engine.groups) for e in engine.enumerate()]
+    assert listed == expected
+    assert len(list(engine.enumerate(limit=5))) == 5
+
+    # a group without any value has no ensembles, found without walking 10 ** 12 assignments
+    matrix = rng.random((10, 12))
+    matrix[:, 4] = np.nan
+    engine = EnsembleEngine(matrix, list(range(10)), list(range(12)))
+    assert list(engine.enumerate(limit=None)) == []
+    assert EnsembleAnalyzer(None, None)(as_frame(matrix)) == []
@@ -0,0 +1,206 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from enums import FairnessMeasure
+from fairness import measures
+from fairness.experiments import calculate_fairness_dfs, run_one_workload
+from fairness.fair_em import FairEM
+from fairness.utils import clauses_satisfied
+from preprocessing import load_test_df
+
+MEASURES = [measure.value for measure in FairnessMeasure]
+AGGREGATES = ["distribution", "subtraction based", "division based", "max", "min", "max_minus_min", "average"]
+MEASURE_FUNCTIONS = {
+    "accuracy_parity": measures.AP,
+    "true_positive_rate_parity": measures.TPR,
+    "false_positive_rate_parity": measures.FPR,
+    "negative_predictive_value_parity": measures.NPV,
+    "positive_predictive_value_parity": measures.PPV,
+}
+
+
+class BruteForce:
+    # the subgroup confusion matrices as Workload counted them before the engine: every
+    # entity pair is encoded as a dense vector and every subgroup is matched against
+    # every pair with clauses_satisfied
+    def __init__(self, test_df, attribute, prediction, delimiter=","):
+        self.sides = [
+            [
+                sorted({item.strip() for item in row[f"{side}_{attribute}"].split(delimiter)})
+                for _, row in test_df.iterrows()
+            ]
+            for side in ("left", "right")
+        ]
+        self.vocabulary = sorted({item for side in self.sides for items in side for item in items})
+        self.encodings = [[self.encode(items) for items in side] for side in self.sides]
+        self.outcomes = []
+        for (ind, row), pred in zip(test_df.iterrows(), prediction[test_df.index.to_numpy(), 0]):
+            if pred:
+                self.outcomes.append(0 if row["label"] else 1)
+            else:
+                self.outcomes.append(3 if row["label"] else 2)
+
+    def encode(self, items):
+        encoding = [0] * len(self.vocabulary)
+        for item in items:
+            encoding[self.vocabulary.index(item)] = 1
+        return encoding
+
+    def count(self, satisfied):
+        conf_matrix = [0] * 4
+        for row, outcome in enumerate(self.outcomes):
+            if satisfied(row):
+                conf_matrix[outcome] += 1
+        return tuple(conf_matrix)
+
+    def single(self, items):
+        encoding = self.encode(items)
+        left, right = self.encodings
+        return self.count(
+            lambda row: clauses_satisfied(encoding, left[row]) or clauses_satisfied(encoding, right[row])
+        )
+
+    def pairwise(self, items1, items2):
+        encoding1 = self.encode(items1) + self.encode(items2)
+        encoding2 = self.encode(items2) + self.encode(items1)
+        left, right = self.encodings
+        return self.count(
+            lambda row: clauses_satisfied(encoding1, left[row] + right[row])
+            or clauses_satisfied(encoding2, left[row] + right[row])
+        )
+
+    def subgroups(self, k, single_fairness):
+        # the names of every subgroup a pair of the test split belongs to
+        names = set()
+        for left, right in zip(*self.sides):
+            if single_fairness:
+                for items in (left, right):
+                    names.update("~".join(comb) for comb in combinations(items, k))
+            else:
+                for comb1 in combinations(left, k):
+                    for comb2 in combinations(right, k):
+                        names.add(frozenset(["~".join(comb1), "~".join(comb2)]))
+        return names
+
+    def conf_matrix(self, name):
+        if "|" not in name:
+            return self.single(name.split("~"))
+        name1, name2 = name.split("|")
+        return self.pairwise(name1.split("~"), name2.split("~"))
+
+
+def aggregate_fairness(conf_matrices, workload_conf_matrix, measure, aggregate):
+    calculate = MEASURE_FUNCTIONS[measure]
+    values = [calculate(*conf_matrix) for conf_matrix in conf_matrices]
+    workload_fairness = calculate(*workload_conf_matrix)
+    if aggregate == "subtraction based":
+        return [workload_fairness - x for x in values]
+    elif aggregate == "division based":
+        return [(workload_fairness / x) - 1 for x in values]
+    elif aggregate == "max":
+        return max(values)
+    elif aggregate == "min":
+        return min(values)
+    elif aggregate == "max_minus_min":
+        return max(values) - min(values)
+    elif aggregate == "average":
+        return np.mean(values)
+    return values
+
+
+def assert_matches_brute_force(workload, brute_force, k):
+    names = [workload.k_combs_to_attr_names[subgroup] for subgroup in workload.k_combs]
+    if workload.single_fairness:
+        assert set(names) == brute_force.subgroups(k, True)
+    else:
+        # a subgroup is found in either orientation of the pairs holding it
+        assert {frozenset(name.split("|")) for name in names} == brute_force.subgroups(k, False)
+    conf_matrices = [brute_force.conf_matrix(name) for name in names]
+    assert workload.get_subgroup_conf_matrices(workload.k_combs) == conf_matrices
+    workload_conf_matrix = brute_force.count(lambda row: True)
+    assert workload.workload_conf_matrix == workload_conf_matrix
+
+    fairEM = FairEM([workload], threshold=0.2)
+    for measure in MEASURES:
+        for aggregate in AGGREGATES:
+            try:
+                expected = aggregate_fairness(conf_matrices, workload_conf_matrix, measure, aggregate)
+            except (ZeroDivisionError, ValueError) as e:
+                # a rate of 0 for division based, no subgroups at all for max and min
+                with pytest.raises(type(e)):
+                    workload.fairness(workload.k_combs, measure, aggregate)
+                continue
+            fairness = workload.fairness(workload.k_combs, measure, aggregate)
+            if aggregate in ("distribution", "subtraction based", "division based"):
+                values, counts = fairness
+                assert values == pytest.approx(expected), (measure, aggregate)
+                assert counts == [sum(conf_matrix) for conf_matrix in conf_matrices]
+            else:
+                assert fairness == pytest.approx(expected, nan_ok=True), (measure, aggregate)
+
+            if aggregate in ("subtraction based", "division based"):
+                is_fair, counts, disparities = fairEM.is_fair(measure, aggregate)
+                assert disparities == pytest.approx(expected)
+                assert is_fair == [fairEM.is_fair_measure_specific(measure, x) for x in expected]
+
+
+@pytest.fixture
+def test_df(workspace):
+    return load_test_df("pairs")
+
+
+def random_predictions(test_df, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"preds": rng.integers(0, 2, len(test_df))}, index=test_df.index)
+
+
+# a single-valued attribute has no 2-combinations, whose average is the nan of an empty mean
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("sparse_encoding", [True, False])
+@pytest.mark.parametrize("k_combinations", [1, 2])
+@pytest.mark.parametrize("attribute", ["venue", "authors"])
+def test_workload_matches_brute_force(test_df, attribute, k_combinations, sparse_encoding):
+    workload = run_one_workload(
+        random_predictions(test_df, 0),
+        test_df,
+        f"left_{attribute}",
+        f"right_{attribute}",
+        k_combinations=k_combinations,
+        sparse_encoding=sparse_encoding,
+    )[0]
+
+    for seed in (0, 1):
+        prediction = random_predictions(test_df, seed).to_numpy()
+        if seed:
+            workload = workload.with_prediction(prediction)
+        brute_force = BruteForce(test_df, attribute, prediction)
+        for single_fairness in (True, False):
+            assert_matches_brute_force(workload.with_fairness_type(single_fairness), brute_force, k_combinations)
+
+
+@pytest.mark.parametrize("attribute", ["venue", "authors"])
+def test_fairness_dfs_match_brute_force(test_df, attribute):
+    prediction_dfs = {seed: random_predictions(test_df, seed) for seed in (0, 1, 2)}
+
+    dfs = calculate_fairness_dfs(
+        test_df=test_df,
+        prediction_dfs=prediction_dfs,
+        left_sens_attribute=f"left_{attribute}",
+        right_sens_attribute=f"right_{attribute}",
+        measures=MEASURES,
+        aggregate="subtraction based",
+        threshold=0.2,
+    )
+
+    for seed, prediction_df in prediction_dfs.items():
+        brute_force = BruteForce(test_df, attribute, prediction_df.to_numpy())
+        workload_conf_matrix = brute_force.count(lambda row: True)
+        for df in dfs[seed].values():
+            for measure, measure_df in df.groupby("measure", sort=False):
+                conf_matrices = [brute_force.conf_matrix(name) for name in measure_df["sens_attr"]]
+                expected = aggregate_fairness(conf_matrices, workload_conf_matrix, measure, "subtraction based")
+                assert list(measure_df["disparities"]) == pytest.approx(expected)
+                assert list(measure_df["counts"]) == [sum(conf_matrix) for conf_matrix in conf_matrices]
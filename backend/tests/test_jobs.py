@@ -0,0 +1,97 @@
+import os
+import time
+
+import pandas as pd
+
+from enums import JobStatus
+from jobs import FINISHED, JobManager
+from matchers import DittoMatcher, RandomForestMatcher
+from score_cache import ScoreManifest
+
+TEST_ROWS = 60
+
+
+def wait(job, timeout: float = 30):
+    deadline = time.time() + timeout
+    while job.status not in FINISHED:
+        assert time.time() < deadline, f"job still {job.status.value}"
+        time.sleep(0.01)
+    return job
+
+
+def scores(matcher_class, dataset_id="pairs") -> pd.Series:
+    return pd.read_csv(os.path.join(matcher_class.get_scores_dir(dataset_id), "preds.csv"))["scores"]
+
+
+def test_job_runs_every_matcher(workspace):
+    job = wait(JobManager.instance().submit(dataset_id="pairs", matcher_classes=[DittoMatcher, RandomForestMatcher],
+                                            epochs=2))
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert set(job.results) == {"ditto", "rfmatcher"}
+    for matcher_class in (DittoMatcher, RandomForestMatcher):
+        assert len(scores(matcher_class)) == TEST_ROWS
+        # the .npy hand-over file is removed once the scores are persisted
+        assert not os.path.exists(os.path.join(matcher_class.get_scores_dir("pairs"), "scores.npy"))
+    progress = [event for event in job.events if event["type"] == "progress" and event["matcher"] == "ditto"]
+    assert [event["epoch"] for event in progress] == [1, 2]
+
+
+def test_unchanged_inputs_reuse_the_cached_scores(workspace):
+    manager = JobManager.instance()
+    wait(manager.submit(dataset_id="pairs", matcher_classes=[DittoMatcher], epochs=1))
+    first = scores(DittoMatcher)
+
+    cached = manager.submit(dataset_id="pairs", matcher_classes=[DittoMatcher], epochs=1)
+    # restored while submitting, nothing was scheduled
+    assert cached.status == JobStatus.SUCCEEDED
+    assert not [event for event in cached.events if event["type"] == "log"]
+    pd.testing.assert_series_equal(scores(DittoMatcher), first)
+
+    wait(manager.submit(dataset_id="pairs", matcher_classes=[DittoMatcher], epochs=2))
+    manifest = ScoreManifest(DittoMatcher.get_scores_dir("pairs")).load()
+    assert len(manifest["entries"]) == 2
+
+
+def test_scores_printed_in_the_log_match_the_score_file(workspace, monkeypatch):
+    wait(JobManager.instance().submit(dataset_id="pairs", matcher_classes=[DittoMatcher], epochs=1))
+    from_file = scores(DittoMatcher)
+
+    monkeypatch.setenv("LOCAL_EXECUTOR_SCORE_OUTPUT", "stdout")
+    monkeypatch.setenv("SCORES_PATH", str(workspace / "stdout_scores"))
+    job = wait(JobManager.instance().submit(dataset_id="pairs", matcher_classes=[DittoMatcher], epochs=1))
+
+    assert job.status == JobStatus.SUCCEEDED
+    pd.testing.assert_series_equal(scores(DittoMatcher), from_file)
+
+
+def test_matcher_without_scores_fails_the_job(workspace):
+    job = wait(JobManager.instance().submit(dataset_id="missing", matcher_classes=[DittoMatcher], epochs=1))
+
+    assert job.status == JobStatus.FAILED
+    assert "no scores" in job.matchers["ditto"]["error"]
+
+
+def test_matcher_whose_inputs_cannot_be_converted_fails_the_job(workspace):
+    # accepted on upload with a warning, the ditto format needs the label
+    pd.read_csv(workspace / "datasets" / "pairs.csv").drop(columns="label").to_csv(
+        workspace / "datasets" / "unlabeled.csv", index=False)
+
+    job = wait(JobManager.instance().submit(dataset_id="unlabeled", matcher_classes=[DittoMatcher], epochs=1))
+
+    assert job.status == JobStatus.FAILED
+    assert job.matchers["ditto"]["status"] == JobStatus.FAILED.value
+    assert JobManager.instance().get(job.id) is job
+
+
+def test_finished_jobs_are_pruned(workspace):
+    manager = JobManager.instance()
+    manager.max_finished = 2
+    jobs = [manager.submit(dataset_id="pairs", matcher_classes=[], epochs=1) for _ in range(4)]
+
+    assert [manager.get(job.id) for job in jobs] == [None, jobs[1], jobs[2], jobs[3]]
+
+    manager.ttl = 0
+    latest = manager.submit(dataset_id="pairs", matcher_classes=[], epochs=1)
+    assert [manager.get(job.id) for job in jobs] == [None] * 4
+    assert manager.get(latest.id) is latest
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fairness.analyzer import PerformanceAnalyzer
+from preprocessing import load_test_df
+
+MEASURES = list(PerformanceAnalyzer.METRICS)
+
+
+def groupby_table(test_df: pd.DataFrame, prediction_mappings: dict, measure: str) -> pd.DataFrame:
+    # the per group metrics as PerformanceAnalyzer computed them before, one groupby per matcher
+    def metric(group: pd.DataFrame):
+        label, preds = group["label"], group["preds"]
+        tp = ((label == 1) & (preds == 1)).sum()
+        fp = ((label == 0) & (preds == 1)).sum()
+        tn = ((label == 0) & (preds == 0)).sum()
+        fn = ((label == 1) & (preds == 0)).sum()
+        numerator, denominator = {
+            "accuracy": (tp + tn, tp + tn + fp + fn),
+            "true_positive_rate": (tp, tp + fn),
+            "false_positive_rate": (fp, fp + tn),
+            "negative_predictive_value": (tn, tn + fn),
+            "positive_predictive_value": (tp, tp + fp),
+        }[measure]
+        return round(numerator / denominator, 3) if denominator > 0 else "-"
+
+    rows = []
+    for matcher, pred_df in prediction_mappings.items():
+        df = pd.merge(test_df, pred_df, left_index=True, right_index=True)
+        values = df.groupby("left_venue")[["label", "preds"]].apply(metric)
+        rows.append(dict(values, matcher=matcher))
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def test_df(workspace):
+    return load_test_df("pairs")
+
+
+@pytest.fixture
+def without_noise(monkeypatch):
+    monkeypatch.setattr(PerformanceAnalyzer, "add_noise", staticmethod(lambda values, mean=0: values.round(3)))
+
+
+def test_tables_match_the_groupby_implementation(test_df, without_noise):
+    rng = np.random.default_rng(0)
+    prediction_mappings = {
+        "perfect": pd.DataFrame({"preds": test_df["label"].to_numpy()}, index=test_df.index),
+        "random": pd.DataFrame({"preds": rng.integers(0, 2, len(test_df))}, index=test_df.index),
+        "none": pd.DataFrame({"preds": np.zeros(len(test_df), dtype=int)}, index=test_df.index),
+    }
+    analyzer = PerformanceAnalyzer(test_df=test_df, sensitive_attribute="venue")
+
+    tables = analyzer.performance_tables(analyzer.stack_predictions(prediction_mappings), MEASURES)
+
+    for measure in MEASURES:
+        expected = groupby_table(test_df, prediction_mappings, measure)
+        table = tables[measure]
+        assert list(table["matcher"]) == list(prediction_mappings)
+        assert sorted(table.columns[1:]) == sorted(expected.columns.drop("matcher"))
+        for group in table.columns[1:]:
+            assert list(table[group]) == list(expected[group]), (measure, group)
+
+
+def test_unsupported_metric_is_rejected(test_df):
+    analyzer = PerformanceAnalyzer(test_df=test_df, sensitive_attribute="venue")
+    with pytest.raises(ValueError, match="Unsupported metric"):
+        analyzer.performance_tables(pd.DataFrame({"m": test_df["label"]}), ["f1"])
+
+
+def test_noise_keeps_values_inside_the_unit_interval():
+    np.random.seed(0)
+    values = np.array([[0.0, 0.5, 1.0], [0.999, 0.001, 0.3]])
+
+    noisy = PerformanceAnalyzer.add_noise(values, mean=0.1)
+
+    assert noisy.shape == values.shape
+    assert ((noisy > 0) & (noisy < 1)).all()
+    assert (noisy == noisy.round(3)).all()
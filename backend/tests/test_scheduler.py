@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+from scheduler import MatcherScheduler, SchedulerFull
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def scheduler(workspace):
+    scheduler = MatcherScheduler.instance()
+    scheduler.max_concurrent = 1
+    scheduler.image_limits = {"a": 1, "b": 1}
+    return scheduler
+
+
+def blocking_run(started: threading.Event, release: threading.Event, result=None):
+    def run(log):
+        started.set()
+        assert release.wait(TIMEOUT)
+        log(f"done {result}")
+        return result
+
+    return run
+
+
+def test_runs_with_the_same_key_are_shared(scheduler):
+    started, release = threading.Event(), threading.Event()
+    calls, first_lines, second_lines = [], [], []
+
+    def run(log):
+        calls.append(1)
+        return blocking_run(started, release, "scores")(log)
+
+    first = scheduler.submit(key="k", image="a", run=run, on_log=first_lines.append)
+    assert started.wait(TIMEOUT)
+    second = scheduler.submit(key="k", image="a", run=run, on_log=second_lines.append)
+    release.set()
+
+    assert first is second
+    assert first.result(TIMEOUT) == "scores"
+    assert len(calls) == 1
+    assert first_lines == second_lines == ["done scores"]
+
+
+def test_waiting_runs_start_by_priority(scheduler):
+    started, release = threading.Event(), threading.Event()
+    order = []
+
+    def record(name):
+        def run(log):
+            order.append(name)
+            return name
+
+        return run
+
+    blocker = scheduler.submit(key="blocker", image="a", run=blocking_run(started, release))
+    assert started.wait(TIMEOUT)
+    low = scheduler.submit(key="low", image="b", run=record("low"), priority=5)
+    high = scheduler.submit(key="high", image="b", run=record("high"), priority=0)
+    assert scheduler.status()["queued"] == 2
+    release.set()
+
+    for future in (blocker, low, high):
+        future.result(TIMEOUT)
+    assert order == ["high", "low"]
+
+
+def test_image_limit_holds_back_runs_of_a_busy_image(scheduler):
+    scheduler.max_concurrent = 2
+    started, release = threading.Event(), threading.Event()
+
+    first = scheduler.submit(key="first", image="a", run=blocking_run(started, release))
+    assert started.wait(TIMEOUT)
+    other = scheduler.submit(key="other", image="b", run=lambda log: "b")
+    same = scheduler.submit(key="same", image="a", run=lambda log: "a")
+
+    assert other.result(TIMEOUT) == "b"
+    assert not same.done()
+    assert scheduler.status()["running"] == {"a": 1}
+    release.set()
+    assert same.result(TIMEOUT) == "a"
+    first.result(TIMEOUT)
+
+
+def test_full_queue_rejects_new_runs(scheduler):
+    scheduler.max_queued = 1
+    started, release = threading.Event(), threading.Event()
+    try:
+        scheduler.submit(key="running", image="a", run=blocking_run(started, release))
+        assert started.wait(TIMEOUT)
+        scheduler.submit(key="queued", image="a", run=lambda log: None)
+        with pytest.raises(SchedulerFull):
+            scheduler.submit(key="rejected", image="a", run=lambda log: None)
+    finally:
+        release.set()
+
+
+def test_failed_run_sets_the_exception_and_frees_its_slot(scheduler):
+    def fail(log):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        scheduler.submit(key="fail", image="a", run=fail).result(TIMEOUT)
+    assert scheduler.submit(key="next", image="a", run=lambda log: "ok").result(TIMEOUT) == "ok"
@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+
+from matchers import DittoMatcher
+from score_cache import ScoreManifest
+from utils import get_ds_path
+
+
+def write_legacy_preds(matcher: DittoMatcher, mtime: float) -> str:
+    # a preds.csv as scored before there was a manifest
+    path = os.path.join(matcher.scores_dir, "preds.csv")
+    pd.DataFrame({"scores": [0.5] * 60}).to_csv(path, index=False)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_legacy_scores_are_adopted_for_the_current_inputs(workspace):
+    matcher = DittoMatcher(dataset_id="pairs", epochs=1)
+    write_legacy_preds(matcher, os.path.getmtime(get_ds_path("pairs")) + 10)
+
+    assert matcher.restore_cached_scores()
+    manifest = ScoreManifest(matcher.scores_dir).load()
+    assert manifest["current"] == matcher.run_key
+    assert list(manifest["entries"]) == [matcher.run_key]
+
+    # other training parameters are trained for
+    assert not DittoMatcher(dataset_id="pairs", epochs=2).restore_cached_scores()
+    assert DittoMatcher(dataset_id="pairs", epochs=1).restore_cached_scores()
+
+
+def test_legacy_scores_older_than_the_upload_are_not_used(workspace):
+    matcher = DittoMatcher(dataset_id="pairs", epochs=1)
+    write_legacy_preds(matcher, os.path.getmtime(get_ds_path("pairs")) - 10)
+
+    assert not matcher.restore_cached_scores()
+    assert not ScoreManifest(matcher.scores_dir).exists()
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from matchers import ScoreParseError, ScoreStreamParser
+
+LOG = [
+    "Epoch 1/1",
+    "==========",
+    "scores",
+    "0.1",
+    "0.2",
+    "0.3",
+    "0.4",
+    "0.5",
+    "==========test==========",
+    "==========",
+    "==========empty==========",
+    "==========",
+    "0.75",
+    "0.25",
+    "==========valid==========",
+]
+
+
+def parse(lines, **kwargs) -> ScoreStreamParser:
+    parser = ScoreStreamParser(**kwargs)
+    for line in lines:
+        parser.feed(line)
+    parser.close()
+    return parser
+
+
+@pytest.mark.parametrize("buffer_size", [1, 2, 5, 1024])
+def test_blocks_are_parsed_for_any_buffer_size(buffer_size):
+    parser = parse(LOG, buffer_size=buffer_size)
+
+    assert [title for title, _ in parser.batches] == ["test", "valid"]
+    np.testing.assert_array_equal(parser.batches[0][1], [0.1, 0.2, 0.3, 0.4, 0.5])
+    # without a header line the first value is a score
+    np.testing.assert_array_equal(parser.batches[1][1], [0.75, 0.25])
+
+
+def test_blocks_larger_than_the_buffer_are_memory_mapped(tmp_path):
+    parser = parse(LOG, buffer_size=3, spill_dir=str(tmp_path))
+
+    assert isinstance(parser.batches[0][1], np.memmap)
+    assert not isinstance(parser.batches[1][1], np.memmap)
+
+
+def test_malformed_score_line_is_rejected():
+    parser = ScoreStreamParser(buffer_size=2)
+    with pytest.raises(ScoreParseError, match="line 6"):
+        for line in ["==========", "scores", "0.1", "0.2", "0.3", "nan?"]:
+            parser.feed(line)
+
+
+def test_unterminated_block_is_rejected():
+    parser = ScoreStreamParser(buffer_size=2)
+    for line in ["==========", "scores", "0.1", "0.2", "0.3"]:
+        parser.feed(line)
+    with pytest.raises(ScoreParseError, match="after 3 scores"):
+        parser.close()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from enums import FairnessMeasure
+from fairness.experiments import calculate_fairness_dfs, calculate_fairness_sweep_dfs
+from preprocessing import load_test_df
+
+MEASURES = [measure.value for measure in FairnessMeasure]
+THRESHOLDS = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+@pytest.fixture
+def test_df(workspace):
+    return load_test_df("pairs")
+
+
+@pytest.mark.parametrize("sparse_encoding", [True, False])
+def test_sweep_matches_one_evaluation_per_threshold(test_df, sparse_encoding):
+    rng = np.random.default_rng(0)
+    scores_df = pd.DataFrame({"scores": rng.random(len(test_df))})
+    arguments = dict(left_sens_attribute="left_venue", right_sens_attribute="right_venue", measures=MEASURES,
+                     aggregate="subtraction based", threshold=0.2, sparse_encoding=sparse_encoding)
+
+    sweep = calculate_fairness_sweep_dfs(test_df=test_df, scores_df=scores_df, matching_thresholds=THRESHOLDS,
+                                         **arguments)
+    # a pair is a predicted match if its score is above the matching threshold
+    expected = calculate_fairness_dfs(
+        test_df=test_df,
+        prediction_dfs={t: (scores_df > t).astype(int).rename(columns={"scores": "preds"}) for t in THRESHOLDS},
+        **arguments,
+    )
+
+    assert set(sweep) == {"single_fairness", "pairwise_fairness"}
+    for fairness_type, df in sweep.items():
+        assert sorted(df["matching_threshold"].unique()) == THRESHOLDS
+        for threshold in THRESHOLDS:
+            at_threshold = df[df["matching_threshold"] == threshold].drop(columns="matching_threshold")
+            assert len(at_threshold) > 0
+            pd.testing.assert_frame_equal(at_threshold.reset_index(drop=True), expected[threshold][fairness_type],
+                                          check_dtype=False)
@@ -1,11 +1,60 @@
 import os
+import threading
 
 import pandas as pd
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 
+from cache import file_signature
+from convertors import split_sizes
+from profiles import load_profile, profile_csv, save_profile
+from storage import load_df
 
-def load_dataset_as_df(dataset_id) -> pd.DataFrame:
-    return pd.read_csv(os.path.join(os.getenv("DATASET_UPLOAD_PATH", "./datasets"), f"{dataset_id}.csv"))
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def load_dataset_as_df(dataset_id, columns=None) -> pd.DataFrame:
+    return load_df(get_ds_path(dataset_id), columns=columns)
 
 
 def get_ds_path(dataset_id: str):
     return os.path.join(os.getenv("DATASET_UPLOAD_PATH", "./datasets"), f"{dataset_id}.csv")
+
+
+def get_profile_path(dataset_id: str):
+    return os.path.join(os.getenv("DATASET_UPLOAD_PATH", "./datasets"), f"{dataset_id}.profile.json")
+
+
+# profiles the dataset in chunks (or completes a profile already computed while
+# uploading) and stores it next to the dataset
+def build_dataset_profile(dataset_id: str, profile: dict = None) -> dict:
+    if profile is None:
+        profile = profile_csv(get_ds_path(dataset_id), chunksize=int(os.getenv("PROFILE_CHUNK_ROWS", 100_000)))
+    profile = dict(profile, splits=split_sizes(profile["rows"]))
+    save_profile(get_profile_path(dataset_id), profile)
+    return profile
+
+
+# the schema, split sizes and left_/right_ value frequencies of a dataset, read from
+# its profile (built once if it is missing or older than the dataset) and kept in memory
+def load_dataset_profile(dataset_id: str) -> dict:
+    path = get_profile_path(dataset_id)
+    if not os.path.isfile(path) or os.path.getmtime(path) < os.path.getmtime(get_ds_path(dataset_id)):
+        build_dataset_profile(dataset_id)
+    signature = file_signature(path)
+    with _profiles_lock:
+        entry = _profiles.get(signature[0])
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+    profile = load_profile(path)
+    with _profiles_lock:
+        _profiles[signature[0]] = (signature, profile)
+    return profile
+
+
+# writes an uploaded CSV to path chunk by chunk
+async def save_upload(file: UploadFile, path: str, chunk_size: int = 1024 * 1024) -> None:
+    with open(path, "wb") as f:
+        while chunk := await file.read(chunk_size):
+            await run_in_threadpool(f.write, chunk)
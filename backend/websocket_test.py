@@ -1,21 +1,22 @@
 import asyncio
+import sys
 
 import aiohttp
 
 
-async def main():
-    ds_sent = False
+async def main(dataset_id, matchers):
     async with aiohttp.ClientSession() as session:
-        async with session.ws_connect('ws://127.0.0.1:8000/ws') as ws:
-            # await for messages and send messages
+        params = [("matchers", m) for m in matchers] + [("epochs", "1")]
+        async with session.get(f'http://127.0.0.1:8000/v1/datasets/{dataset_id}/match/', params=params) as response:
+            job_id = (await response.json())["job_id"]
+
+        async with session.ws_connect(f'ws://127.0.0.1:8000/ws/jobs/{job_id}') as ws:
+            # await for the job's log lines, progress and status changes
             async for msg in ws:
                 if msg.type == aiohttp.WSMsgType.TEXT:
                     print(f'SERVER says - {msg.data}')
-                    if not ds_sent:
-                        await ws.send_str("dataset_id=train_1")
-                        ds_sent = True
                 elif msg.type == aiohttp.WSMsgType.ERROR:
                     break
 
 
-asyncio.run(main())
+asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "train_1", sys.argv[2:] or ["Ditto"]))
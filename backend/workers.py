@@ -0,0 +1,33 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    # started on first use with WORKER_PROCESSES workers (one per core by default)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1)))
+        return _pool
+
+
+async def run_in_process(func: Callable[..., Any], *args, **kwargs) -> Any:
+    # runs a CPU-bound function in the worker pool without blocking the event loop,
+    # func and its arguments must be picklable
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_worker_pool(), partial(func, *args, **kwargs))
+
+
+def shutdown_worker_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
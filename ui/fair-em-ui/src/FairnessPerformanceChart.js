@@ -27,6 +27,12 @@ const FairnessPerformanceChart = ({data, handlePointClick}) => {
         return true;
     };
 
+    // the backend flags the frontier, it may only send part of the ensembles
+    const isOnFrontier = (point, dataset) =>
+        point.frontier !== undefined
+            ? point.frontier
+            : isParetoFrontier(point, dataset.data, dataset.xObj, dataset.yObj);
+
     const getTooltipCallbacks = () => ({
         callbacks: {
             label: (context) => {
@@ -112,13 +118,13 @@ const FairnessPerformanceChart = ({data, handlePointClick}) => {
             })),
             pointBackgroundColor: dataset.data.map(
                 (point) =>
-                    isParetoFrontier(point, dataset.data, dataset.xObj, dataset.yObj)
+                    isOnFrontier(point, dataset)
                         ? stringToColor(dataset.name, 0.5)
                         : stringToColor(dataset.name, 0.1)
             ),
             pointBorderColor: dataset.data.map(
                 (point) =>
-                    isParetoFrontier(point, dataset.data, dataset.xObj, dataset.yObj)
+                    isOnFrontier(point, dataset)
                         ? stringToColor(dataset.name, 0.9)
                         : stringToColor(dataset.name, 0.2)
             ),